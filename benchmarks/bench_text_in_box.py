@@ -0,0 +1,84 @@
+"""Compare bounding box lookups with and without a PageIndex."""
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from parse_990_textract.models import PageIndex
+
+
+def make_page(n_words, seed=0):
+    rng = np.random.default_rng(seed)
+    midpoint_y = rng.random(n_words).astype(np.float32)
+    midpoint_x = rng.random(n_words).astype(np.float32)
+    return pd.DataFrame(
+        {
+            "Midpoint_X": midpoint_x,
+            "Midpoint_Y": midpoint_y,
+            "Text": [f"w{i}" for i in range(n_words)],
+            "WordIndex": np.lexsort(
+                (midpoint_x, np.round(midpoint_y, 2))
+            ).argsort(),
+        }
+    )
+
+
+def make_boxes(n_boxes, seed=1):
+    rng = np.random.default_rng(seed)
+    left = rng.random(n_boxes) * 0.8
+    top = rng.random(n_boxes) * 0.95
+    return list(
+        zip(
+            left,
+            left + rng.random(n_boxes) * 0.2,
+            top,
+            top + rng.random(n_boxes) * 0.05,
+        )
+    )
+
+
+def scan_text(page, left, right, top, bottom):
+    """The lookup BoundingBox.get_text_in_box made before PageIndex."""
+    page_text = page.sort_values(by="WordIndex")
+    text_in_box = page_text.loc[
+        lambda df: (
+            df["Midpoint_X"].between(left, right)
+            & df["Midpoint_Y"].between(top, bottom)
+        ),
+        "Text",
+    ].agg(lambda x: " ".join(x.values))
+    if not any(text_in_box):
+        return ""
+    return text_in_box
+
+
+def main(n_words=2000, n_boxes=320):
+    page = make_page(n_words)
+    boxes = make_boxes(n_boxes)
+    index = PageIndex(page)
+    assert [scan_text(page, *box) for box in boxes] == [
+        index.get_text(*box) for box in boxes
+    ]
+    scan = min(
+        timeit.repeat(
+            lambda: [scan_text(page, *box) for box in boxes],
+            number=1,
+            repeat=3,
+        )
+    )
+    indexed = min(
+        timeit.repeat(
+            lambda: [PageIndex(page).get_text(*box) for box in boxes[:1]]
+            + [index.get_text(*box) for box in boxes[1:]],
+            number=1,
+            repeat=3,
+        )
+    )
+    print(f"{n_words} words, {n_boxes} boxes")
+    print(f"scan:    {scan * 1000:8.1f} ms")
+    print(f"indexed: {indexed * 1000:8.1f} ms (including building the index)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,312 @@
+"""Synthetic Textract output for 990s, for benchmarks."""
+import json
+import os
+import random
+import sre_constants
+import sre_parse
+import uuid
+
+import pandas as pd
+
+from parse_990_textract.setup import PARSE_DATA_DIR
+
+PAGE_LABELS = {
+    1: "Page 1",
+    3: "Page 3",
+    9: "Page 9",
+    10: "Page 10",
+    11: "Schedule F, Page 1",
+    12: "Schedule F, Page 2",
+}
+PAGE_TITLES = {
+    3: "Statement of Program Service Accomplishments",
+    9: "Statement of Revenue",
+    10: "Statement of Functional Expenses",
+    11: "General Information on Activities Outside",
+}
+TABLES = {
+    11: (
+        "Activities per Region",
+        [
+            "(a) Region",
+            "(b) Number of offices in the",
+            "(c) Number of employees",
+            "(d) Activities conducted",
+            "(e) If activity listed",
+            "(f) Total expenditures",
+        ],
+        "by region)",
+    ),
+    12: (
+        "Grants to Organizations Outside the United States",
+        [
+            "(a) Name of organization",
+            "(b) IRS code",
+            "(c) Region",
+            "(d) Purpose of grant",
+            "(e) Amount of cash",
+            "(f) Manner",
+            "(g) Amount of noncash",
+            "(h) Description",
+            "(i) Method",
+        ],
+        "other)",
+    ),
+}
+TABLE_AMOUNT_COLUMNS = (1, 2, 4, 5, 6)
+TABLE_WORDS = ["Europe", "East Asia", "Program services", "Wire", "N/A"]
+FILLER_WORDS = [
+    "the",
+    "of",
+    "and",
+    "990",
+    "total",
+    "12,345",
+    "revenue",
+    "(2,000)",
+    "O00",
+    "grant",
+]
+CHAR_WIDTH = 0.006
+LINE_HEIGHT = 0.009
+
+
+def sample_text(pattern, rng):
+    """Return a string matching the simple regex `pattern`."""
+
+    def generate(parsed):
+        return "".join(generate_item(op, av) for (op, av) in parsed)
+
+    def generate_item(op, av):
+        if op is sre_constants.LITERAL:
+            return chr(av)
+        if op is sre_constants.NOT_LITERAL:
+            return "x" if chr(av) != "x" else "y"
+        if op is sre_constants.ANY:
+            return "a"
+        if op is sre_constants.IN:
+            return generate_in(av)
+        if op is sre_constants.BRANCH:
+            return generate(rng.choice(av[1]))
+        if op is sre_constants.SUBPATTERN:
+            return generate(av[-1])
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, item = av
+            return generate(item) * max(low, 1 if high > 0 else 0)
+        if op is sre_constants.CATEGORY:
+            return generate_category(av)
+        return ""
+
+    def generate_in(items):
+        if any(op is sre_constants.NEGATE for (op, _av) in items):
+            return "q"
+        op, av = items[0]
+        if op is sre_constants.LITERAL:
+            return chr(av)
+        if op is sre_constants.RANGE:
+            return chr(av[0])
+        if op is sre_constants.CATEGORY:
+            return generate_category(av)
+        return "a"
+
+    def generate_category(av):
+        return {
+            sre_constants.CATEGORY_DIGIT: "1",
+            sre_constants.CATEGORY_SPACE: " ",
+            sre_constants.CATEGORY_WORD: "a",
+        }.get(av, "b")
+
+    return generate(sre_parse.parse(pattern))
+
+
+class PageWriter:
+    """Lay out LINE and WORD blocks on one page of a synthetic job."""
+
+    def __init__(self, blocks, page, orientation, rng):
+        self.blocks = blocks
+        self.page = page
+        self.orientation = orientation
+        self.rng = rng
+
+    def block(self, block_type, text, left, top, width, height):
+        # Jitter keeps lines from sharing a Top, as scanned lines never do
+        top += self.rng.uniform(0, 1e-4)
+        points = [
+            (left, top),
+            (left + width, top),
+            (left + width, top + height),
+            (left, top + height),
+        ]
+        if self.orientation == 90:
+            points = [(y, 1 - x) for (x, y) in points]
+        elif self.orientation == 180:
+            points = [(1 - x, 1 - y) for (x, y) in points]
+        elif self.orientation == 270:
+            points = [(1 - y, x) for (x, y) in points]
+        xs = [x for (x, _y) in points]
+        ys = [y for (_x, y) in points]
+        block = {
+            "BlockType": block_type,
+            "Confidence": 99.0,
+            "Geometry": {
+                "BoundingBox": {
+                    "Width": max(xs) - min(xs),
+                    "Height": max(ys) - min(ys),
+                    "Left": min(xs),
+                    "Top": min(ys),
+                },
+                "Polygon": [{"X": x, "Y": y} for (x, y) in points],
+            },
+            "Id": str(uuid.UUID(int=self.rng.getrandbits(128))),
+            "Page": self.page,
+        }
+        if text is not None:
+            block["Text"] = text
+            block["TextType"] = "PRINTED"
+        return block
+
+    def page_block(self):
+        self.blocks.append(self.block("PAGE", None, 0, 0, 1, 1))
+
+    def line(self, text, left, top):
+        words = []
+        right = left
+        for word in text.split(" "):
+            width = max(len(word), 1) * CHAR_WIDTH
+            words.append(
+                self.block("WORD", word, right, top, width, LINE_HEIGHT)
+            )
+            right += width + CHAR_WIDTH
+        line = self.block(
+            "LINE",
+            text,
+            left,
+            top,
+            max(right - CHAR_WIDTH - left, CHAR_WIDTH),
+            LINE_HEIGHT,
+        )
+        line["Relationships"] = [
+            {"Type": "CHILD", "Ids": [word["Id"] for word in words]}
+        ]
+        # Textract lists each line before its words
+        self.blocks.append(line)
+        self.blocks.extend(words)
+
+    def table(self, headers, header_end, n_rows):
+        lefts = [0.02 + i * (0.95 / len(headers)) for i in range(len(headers))]
+        for left, header in zip(lefts, headers):
+            self.line(header, left, 0.1)
+        self.line(header_end, 0.02, 0.14)
+        for row in range(n_rows):
+            top = 0.17 + row * 0.025
+            for col, left in enumerate(lefts):
+                if col in TABLE_AMOUNT_COLUMNS:
+                    self.line(f"{self.rng.randint(1, 99999):,}", left, top)
+                elif self.rng.random() < 0.7:
+                    self.line(self.rng.choice(TABLE_WORDS), left, top)
+            if self.rng.random() < 0.3:
+                self.line("continued text", lefts[0], top + 0.011)
+        self.line("3a Subtotal 2 Enter total For Paperwork", 0.02, 0.6)
+
+    def filler(self, n_lines, words_per_line):
+        for i in range(n_lines):
+            self.line(
+                " ".join(
+                    self.rng.choice(FILLER_WORDS)
+                    for _ in range(self.rng.randint(1, words_per_line))
+                ),
+                self.rng.uniform(0.05, 0.6),
+                0.3 + 0.6 * i / n_lines,
+            )
+
+
+def field_boxes(roadmap, extractors, label):
+    """Yield (field, left, right, top, bottom) for a page's words fields."""
+    defaults = roadmap.set_index("landmark")
+    for _idx, row in extractors.loc[extractors["page"] == label].iterrows():
+        if row["strategy"] != "words":
+            continue
+        try:
+            left = defaults.at[row["left"], "left_default"]
+            right = defaults.at[row["right"], "left_default"]
+            top = defaults.at[row["top"], "top_default"]
+            bottom = defaults.at[row["bottom"], "top_default"]
+        except KeyError:
+            continue
+        left += row["left_delta"]
+        right += row["right_delta"]
+        top += row["top_delta"]
+        bottom += row["bottom_delta"]
+        if right - left >= 0.03 and bottom - top >= 0.004:
+            yield row["field_name"], left, right, top, bottom
+
+
+def generate_job(
+    n_pages=20,
+    seed=0,
+    rotated_pages=(5, 7),
+    filler_lines=40,
+    words_per_line=8,
+    parse_data_dir=PARSE_DATA_DIR,
+):
+    """Return the blocks of a synthetic 990 and the amounts placed in it."""
+    rng = random.Random(seed)
+    roadmap = pd.read_csv(os.path.join(parse_data_dir, "990_roadmap.csv"))
+    extractors = pd.read_csv(
+        os.path.join(parse_data_dir, "990_extractors.csv")
+    )
+    blocks = []
+    expected = {}
+    for page in range(1, n_pages + 1):
+        writer = PageWriter(
+            blocks, page, 90 if page in rotated_pages else 0, rng
+        )
+        writer.page_block()
+        if page in PAGE_TITLES:
+            writer.line(PAGE_TITLES[page], 0.2, 0.04)
+        label = PAGE_LABELS.get(page)
+        landmarks = roadmap.loc[roadmap["page"] == label]
+        for _idx, row in landmarks.iterrows():
+            writer.line(
+                sample_text(row["regex"], rng).strip() or row["landmark"],
+                row["left_default"] + rng.uniform(-0.005, 0.005),
+                row["top_default"] + rng.uniform(-0.003, 0.003),
+            )
+        for field, left, right, top, bottom in field_boxes(
+            roadmap, extractors, label
+        ):
+            amount = rng.randint(0, 9999999)
+            writer.line(
+                f"{amount:,}",
+                (left + right) / 2 - 0.02,
+                (top + bottom) / 2 - LINE_HEIGHT / 2,
+            )
+            expected[field] = amount
+        if page in TABLES:
+            _name, headers, header_end = TABLES[page]
+            writer.table(headers, header_end, n_rows=12)
+        writer.filler(filler_lines, words_per_line)
+        if page == 1:
+            writer.line("Form 990 (2010)", 0.05, 0.95)
+    return blocks, expected
+
+
+def write_job(blocks, directory, job_id, n_parts=3, prefix="textract-output"):
+    """Write blocks as a job's Textract output parts under `directory`."""
+    path = os.path.join(directory, prefix, job_id)
+    os.makedirs(path, exist_ok=True)
+    part_size = -(-len(blocks) // n_parts)
+    for part in range(n_parts):
+        start, end = part * part_size, (part + 1) * part_size
+        with open(os.path.join(path, str(part + 1)), "w") as f:
+            json.dump(
+                {
+                    "DocumentMetadata": {"Pages": blocks[-1]["Page"]},
+                    "JobStatus": "SUCCEEDED",
+                    "Blocks": blocks[start:end],
+                    "DetectDocumentTextModelVersion": "1.0",
+                },
+                f,
+            )
+    with open(os.path.join(path, ".s3_access_check"), "w") as f:
+        f.write("")
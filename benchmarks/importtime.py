@@ -0,0 +1,150 @@
+"""Time a cold start of the parser: importing it and loading the spec."""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from .run import RESULTS_DIR, git_commit
+
+PACKAGE = "parse_990_textract"
+DEFERRED_MODULES = ("boto3", "botocore")
+COLD_START = f"""
+import json, sys, time
+start = time.perf_counter()
+import {PACKAGE}
+from {PACKAGE}.setup import get_parse_spec
+imported = time.perf_counter()
+get_parse_spec()
+print(json.dumps({{
+    "spec_s": time.perf_counter() - imported,
+    "modules": sorted(sys.modules),
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line.replace("import time:", "", 1).split("|")
+        self_us, cumulative_us, module = fields
+        if not self_us.strip().isdigit():
+            continue
+        times[module.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def cold_start():
+    """Start a fresh interpreter, returning its import and spec times."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", COLD_START],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = parse_importtime(result.stderr)
+    return {
+        "import_s": times[PACKAGE][1] / 1e6,
+        "times": times,
+        **json.loads(result.stdout),
+    }
+
+
+def run(repeat, top=15):
+    runs = [cold_start() for _ in range(repeat)]
+    fastest = min(runs, key=lambda run: run["import_s"])
+    slowest_modules = sorted(
+        fastest["times"].items(), key=lambda item: item[1][0], reverse=True
+    )[:top]
+    return {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "repeat": repeat,
+        "import_s": round(fastest["import_s"], 6),
+        "spec_s": round(min(run["spec_s"] for run in runs), 6),
+        "slowest_modules": {
+            module: round(self_us / 1e6, 6)
+            for (module, (self_us, _cumulative)) in slowest_modules
+        },
+        "deferred_imported": sorted(
+            module
+            for module in fastest["modules"]
+            if module.split(".")[0] in DEFERRED_MODULES
+        ),
+    }
+
+
+def save(results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"importtime-{results['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def load(commit):
+    with open(os.path.join(RESULTS_DIR, f"importtime-{commit}.json")) as f:
+        return json.load(f)
+
+
+def print_results(results):
+    print(f"import {PACKAGE:30} {results['import_s']:10.4f}s")
+    print(f"load parse spec {'':23} {results['spec_s']:10.4f}s")
+    print("slowest modules (self time)")
+    for module, seconds in results["slowest_modules"].items():
+        print(f"  {module:38} {seconds:10.4f}s")
+
+
+def compare(results, baseline, tolerance):
+    """Print times next to a baseline's. Return False if either regressed."""
+    fast_enough = True
+    print(f"{'':40} {baseline['commit']:>14} {results['commit']:>14}")
+    for key, label in (("import_s", "import"), ("spec_s", "load spec")):
+        ratio = results[key] / baseline[key]
+        print(
+            f"{label:40} {baseline[key]:13.4f}s {results[key]:13.4f}s"
+            f" {ratio:6.2f}x"
+        )
+        if ratio > 1 + tolerance:
+            print(f"  REGRESSION: {label} is {ratio:.2f}x slower")
+            fast_enough = False
+    return fast_enough
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.importtime")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--compare", help="Commit whose results to compare")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown against --compare (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+    # Load the baseline first, in case these results replace it
+    baseline = load(args.compare) if args.compare else None
+    results = run(args.repeat)
+    print(f"Saved results to {save(results)}")
+    print_results(results)
+    ok = True
+    if results["deferred_imported"]:
+        print(
+            "REGRESSION: imported on startup: "
+            + ", ".join(results["deferred_imported"])
+        )
+        ok = False
+    if baseline is not None:
+        ok = compare(results, baseline, args.tolerance) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Time each stage of the parser on synthetic and recorded Textract jobs."""
+import argparse
+import json
+import logging
+import math
+import numbers
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from collections import defaultdict
+
+import pandas as pd
+
+import parse_990_textract
+from parse_990_textract.metrics import recording
+from parse_990_textract.sources import LocalSource
+
+from .fixtures import generate_job, write_job
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+VALIDATION_DATA = "validation_data.csv"
+PREFIX = "textract-output"
+
+
+def git_commit():
+    """Return the short hash of HEAD, marked if the tree has changes."""
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"]).returncode
+    return f"{commit}-dirty" if dirty else commit
+
+
+def synthetic_jobs(directory, page_counts):
+    """Write a synthetic job per page count, yielding (job_id, expected)."""
+    for n_pages in page_counts:
+        job_id = f"synthetic-{n_pages}"
+        blocks, expected = generate_job(n_pages, seed=n_pages)
+        write_job(blocks, directory, job_id)
+        yield job_id, expected
+
+
+def recorded_jobs(directory, validation_data):
+    """Yield (job_id, expected) for the recorded jobs in `directory`."""
+    validation = validation_data.set_index("job_id")
+    for job_id in sorted(os.listdir(os.path.join(directory, PREFIX))):
+        if job_id not in validation.index:
+            expected = {}
+        else:
+            expected = validation.loc[job_id].drop("pdf_key").dropna()
+            expected = expected.to_dict()
+        yield job_id, expected
+
+
+def matches(value, expected):
+    if isinstance(expected, numbers.Number):
+        try:
+            return math.isclose(float(value), expected)
+        except (TypeError, ValueError):
+            return False
+    return str(value).strip() == str(expected).strip()
+
+
+def score(result, expected):
+    """Return the number of expected filing values found, and the total."""
+    filing_data = json.loads(result["filing_data"])
+    found = sum(
+        matches(filing_data.get(field, {}).get("0"), value)
+        for (field, value) in expected.items()
+    )
+    return found, len(expected)
+
+
+def benchmark_job(source, job_id, expected, repeat):
+    pdf_key = f"EIN_000000000_YEAR_2010_FORMTYPE_990_{job_id}.pdf"
+    stages = defaultdict(lambda: math.inf)
+    for _ in range(repeat):
+        with recording(enabled=True) as metrics:
+            result = parse_990_textract.parse_filing(source, job_id, pdf_key)
+        totals = defaultdict(float)
+        for record in metrics.records:
+            totals[record["stage"]] += record["wall_s"]
+        for stage, seconds in totals.items():
+            stages[stage] = min(stages[stage], seconds)
+    event = {
+        "bucket_name": str(source),
+        "textract_job_id": job_id,
+        "pdf_key": pdf_key,
+    }
+    handler_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_990_textract.handler(event, None)
+        handler_times.append(time.perf_counter() - start)
+    found, total = score(result, expected)
+    return {
+        "stages": {
+            stage: round(seconds, 6) for (stage, seconds) in stages.items()
+        },
+        "handler_s": round(min(handler_times), 6),
+        "found": found,
+        "expected": total,
+        "accuracy": round(found / total, 4) if total else None,
+    }
+
+
+def run(page_counts, repeat, recorded_dir=None):
+    # Time the parser itself, not the frame cache or the logging
+    parse_990_textract.frame_cache = None
+    logging.disable(logging.CRITICAL)
+    warnings.simplefilter("ignore", UserWarning)
+    jobs = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = LocalSource(directory)
+        for job_id, expected in synthetic_jobs(directory, page_counts):
+            jobs[job_id] = benchmark_job(source, job_id, expected, repeat)
+        if recorded_dir is not None:
+            source = LocalSource(recorded_dir)
+            validation_data = pd.read_csv(VALIDATION_DATA)
+            for job_id, expected in recorded_jobs(
+                recorded_dir, validation_data
+            ):
+                jobs[job_id] = benchmark_job(source, job_id, expected, repeat)
+    logging.disable(logging.NOTSET)
+    return {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "repeat": repeat,
+        "jobs": jobs,
+    }
+
+
+def save(results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def load(commit):
+    with open(os.path.join(RESULTS_DIR, f"{commit}.json")) as f:
+        return json.load(f)
+
+
+def compare(results, baseline):
+    """Print timings next to a baseline's. Return False if accuracy fell."""
+    print(
+        f"{'job / stage':40} {baseline['commit']:>14} {results['commit']:>14}"
+    )
+    accurate = True
+    for job_id, job in results["jobs"].items():
+        old = baseline["jobs"].get(job_id)
+        if old is None:
+            continue
+        print(job_id)
+        old_stages = {**old["stages"], "handler": old["handler_s"]}
+        for stage, seconds in [
+            *job["stages"].items(),
+            ("handler", job["handler_s"]),
+        ]:
+            old_seconds = old_stages.get(stage, math.nan)
+            ratio = seconds / old_seconds if old_seconds else math.nan
+            print(
+                f"  {stage:38} {old_seconds:13.4f}s {seconds:13.4f}s"
+                f" {ratio:6.2f}x"
+            )
+        print(
+            f"  {'accuracy':38} {old['accuracy']!s:>14}"
+            f" {job['accuracy']!s:>14}"
+        )
+        if (job["accuracy"] or 0) < (old["accuracy"] or 0):
+            print(f"  ACCURACY REGRESSION in {job_id}")
+            accurate = False
+    return accurate
+
+
+def print_results(results):
+    for job_id, job in results["jobs"].items():
+        print(job_id)
+        for stage, seconds in job["stages"].items():
+            print(f"  {stage:38} {seconds:10.4f}s")
+        print(f"  {'handler':38} {job['handler_s']:10.4f}s")
+        print(
+            f"  {'accuracy':38} {job['found']}/{job['expected']}"
+            f" ({job['accuracy']})"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 60, 150])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--recorded", help="Directory of recorded jobs")
+    parser.add_argument("--compare", help="Commit whose results to compare")
+    args = parser.parse_args(argv)
+    # Load the baseline first, in case these results replace it
+    baseline = load(args.compare) if args.compare else None
+    results = run(args.pages, args.repeat, args.recorded)
+    print(f"Saved results to {save(results)}")
+    if baseline is None:
+        print_results(results)
+        return 0
+    return 0 if compare(results, baseline) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
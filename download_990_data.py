@@ -1,108 +1,258 @@
-import sys
+import argparse
+import csv
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import boto3
 import pandas as pd
+from boto3.dynamodb.conditions import Attr
 
+from parse_990_textract.encoding import decode_frame
 
-def get_rows_from_db(table, row_filter, attrs, key_filter, **scan_kwargs):
-    """Return attributes from DynamoDB table that match filter.
+SEGMENTS = 8
+QUEUE_SIZE = 1000
+ATTRS = (
+    "job_id",
+    "pdf_key",
+    "filing_data",
+    "part_i_data",
+    "part_ii_data",
+    "part_iii_data",
+    "source_url",
+    "year",
+    "encoding",
+)
+OUTPUTS = {
+    "filing_data": "990_filing_data",
+    "part_i_data": "990_sched_f_part_i_data",
+    "part_ii_data": "990_sched_f_part_ii_data",
+    "part_iii_data": "990_sched_f_part_iii_data",
+}
+_DONE = object()
 
-    This assumes that each item in the DB has an attribute named 'documents'.
-    """
-    last_evaluated = True
-    while last_evaluated:
+
+def open_table(table_name, endpoint_url=None):
+    """Return a DynamoDB table with its own session, for use in one thread."""
+    session = boto3.session.Session()
+    return session.resource("dynamodb", endpoint_url=endpoint_url).Table(
+        table_name
+    )
+
+
+def scan_segment(table, **scan_kwargs):
+    """Yield every item from a (segment of a) scan, following pages."""
+    while True:
         results = table.scan(**scan_kwargs)
-        for item in results["Items"]:
-            if row_filter(item):
-                for doc in item.get("documents", []):
-                    if key_filter(doc):
-                        match_entry = {}
-                        for attr in attrs:
-                            match_entry[attr] = doc.get(attr)
-                        yield match_entry
+        yield from results["Items"]
         if last_evaluated_key := results.get("LastEvaluatedKey"):
             scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
         else:
-            last_evaluated = False
+            return
+
+
+def parallel_scan(
+    table_name, segments=SEGMENTS, endpoint_url=None, **scan_kwargs
+):
+    """Yield the items of a table, scanning `segments` segments at once."""
+    # Bounded, so only a few pages are held however large the table is
+    items = queue.Queue(QUEUE_SIZE)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
 
+    def scan(segment):
+        try:
+            table = open_table(table_name, endpoint_url)
+            for item in scan_segment(
+                table, Segment=segment, TotalSegments=segments, **scan_kwargs
+            ):
+                if stopped.is_set():
+                    return
+                put(item)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
 
-def download_990_data(table_name, bucket_name):
-    table = boto3.resource("dynamodb").Table(table_name)
-    filing_data = []
-    sched_f_part_i_data = []
-    sched_f_part_ii_data = []
-    sched_f_part_iii_data = []
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        for segment in range(segments):
+            executor.submit(scan, segment)
+        remaining = segments
+        try:
+            while remaining:
+                item = items.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stopped.set()
+
+
+def get_rows_from_db(
+    table_name,
+    doc_type,
+    attrs,
+    key_filter,
+    segments=SEGMENTS,
+    endpoint_url=None,
+):
+    """Return attributes of the documents of items with `doc_type`."""
+    # DynamoDB filters on doc_type and returns only each item's 'documents'
+    for item in parallel_scan(
+        table_name,
+        segments,
+        endpoint_url,
+        FilterExpression=Attr("doc_type").eq(doc_type),
+        ProjectionExpression="#documents",
+        ExpressionAttributeNames={"#documents": "documents"},
+    ):
+        for doc in item.get("documents", []):
+            if key_filter(doc):
+                yield {attr: doc.get(attr) for attr in attrs}
+
+
+def iter_990_data(table_name, segments=SEGMENTS, endpoint_url=None):
+    """Yield (output, frame) for each table parsed from each 990."""
     for row in get_rows_from_db(
-        table,
-        lambda row: row["doc_type"] == "990",
-        (
-            "job_id",
-            "pdf_key",
-            "filing_data",
-            "part_i_data",
-            "part_ii_data",
-            "part_iii_data",
-            "source_url",
-            "year",
-        ),
+        table_name,
+        "990",
+        ATTRS,
         lambda doc: (
             not doc.get("error_on_parse", False) and doc.get("job_id")
         ),
+        segments,
+        endpoint_url,
     ):
-        if row["filing_data"]:
-            row["filing_data"] = {
-                key: value["0"] for (key, value) in row["filing_data"].items()
-            }
-            row["filing_data"]["job_id"] = row["job_id"]
-            row["filing_data"]["source_url"] = row["source_url"]
-            filing_data.append(row["filing_data"])
-        if row["part_i_data"]:
-            row_part_i_data = pd.DataFrame.from_dict(row["part_i_data"])
-            row_part_i_data["job_id"] = row["job_id"]
-            row_part_i_data["source_url"] = row["source_url"]
-            sched_f_part_i_data.append(row_part_i_data)
-        if row["part_ii_data"]:
-            row_part_ii_data = pd.DataFrame.from_dict(row["part_ii_data"])
-            row_part_ii_data["job_id"] = row["job_id"]
-            row_part_ii_data["source_url"] = row["source_url"]
-            sched_f_part_ii_data.append(row_part_ii_data)
-        if row["part_iii_data"]:
-            row_part_iii_data = pd.DataFrame.from_dict(row["part_iii_data"])
-            row_part_iii_data["job_id"] = row["job_id"]
-            row_part_iii_data["source_url"] = row["source_url"]
-            sched_f_part_iii_data.append(row_part_iii_data)
-    return {
-        "filing_data": pd.DataFrame.from_records(filing_data),
-        "sched_f_part_i_data": pd.concat(sched_f_part_i_data).reset_index(
-            drop=True
-        ),
-        "sched_f_part_ii_data": pd.concat(sched_f_part_ii_data).reset_index(
-            drop=True
-        ),
-        "sched_f_part_iii_data": pd.concat(sched_f_part_iii_data).reset_index(
-            drop=True
-        ),
+        encoding = row["encoding"] or "records"
+        for key in OUTPUTS:
+            frame = decode_frame(row[key], encoding)
+            if frame is None:
+                continue
+            if key == "filing_data":
+                frame = frame.iloc[[0]]
+            frame = frame.assign(
+                job_id=row["job_id"], source_url=row["source_url"]
+            )
+            yield key, frame
+
+
+def download_990_data(
+    table_name, bucket_name=None, segments=SEGMENTS, endpoint_url=None
+):
+    """Return every 990's parsed tables as four DataFrames, all in memory."""
+    frames = {key: [] for key in OUTPUTS}
+    for key, frame in iter_990_data(table_name, segments, endpoint_url):
+        frames[key].append(frame)
+    downloaded = {}
+    for key, data in frames.items():
+        name = key if key == "filing_data" else f"sched_f_{key}"
+        downloaded[name] = (
+            pd.concat(data).reset_index(drop=True) if data else pd.DataFrame()
+        )
+    return downloaded
+
+
+class CSVWriter:
+    """Append DataFrames with varying columns to one CSV file."""
+
+    def __init__(self, path, first_columns=()):
+        self.path = path
+        self.columns = list(first_columns)
+        self.rows = 0
+        self.body = tempfile.NamedTemporaryFile(
+            "w+", newline="", dir=os.path.dirname(path) or ".", delete=False
+        )
+        self.writer = csv.writer(self.body)
+
+    def write(self, df):
+        df = df.loc[:, ~df.columns.duplicated(keep="last")]
+        # New columns go at the end, so earlier rows are just short
+        self.columns.extend(
+            column for column in df.columns if column not in self.columns
+        )
+        df = df.reindex(columns=self.columns)
+        self.writer.writerows(
+            df.astype(object)
+            .where(df.notna(), None)
+            .itertuples(index=False, name=None)
+        )
+        self.rows += len(df)
+
+    def close(self):
+        # The header, with every column seen, goes before the rows
+        self.body.flush()
+        self.body.seek(0)
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerow(self.columns)
+            shutil.copyfileobj(self.body, f)
+        self.body.close()
+        os.remove(self.body.name)
+
+
+def write_990_data(
+    table_name, output_dir, now, segments=SEGMENTS, endpoint_url=None
+):
+    """Stream every 990's parsed tables into four CSVs; return row counts."""
+    writers = {
+        key: CSVWriter(
+            os.path.join(output_dir, f"{name}-{now}.csv"),
+            ("filing_id",) if key == "filing_data" else (),
+        )
+        for (key, name) in OUTPUTS.items()
     }
+    try:
+        for key, frame in iter_990_data(table_name, segments, endpoint_url):
+            writers[key].write(frame)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {key: writer.rows for (key, writer) in writers.items()}
 
 
-def main():
-    table_name = sys.argv[1]
-    bucket_name = sys.argv[2]
-    now = datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
-    downloaded = download_990_data(table_name, bucket_name)
-    downloaded["filing_data"].set_index("filing_id").to_csv(
-        f"output_data/990_filing_data-{now}.csv"
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download parsed 990 data from DynamoDB to CSV files."
+    )
+    parser.add_argument("table_name")
+    parser.add_argument(
+        "bucket_name", nargs="?", help="Unused; kept for compatibility"
     )
-    downloaded["sched_f_part_i_data"].to_csv(
-        f"output_data/990_sched_f_part_i_data-{now}.csv", index=False
+    parser.add_argument("-o", "--output-dir", default="output_data")
+    parser.add_argument(
+        "-s",
+        "--segments",
+        type=int,
+        default=SEGMENTS,
+        help="Number of table segments to scan in parallel",
     )
-    downloaded["sched_f_part_ii_data"].to_csv(
-        f"output_data/990_sched_f_part_ii_data-{now}.csv", index=False
+    parser.add_argument(
+        "--endpoint-url", help="DynamoDB endpoint, e.g. a local DynamoDB"
     )
-    downloaded["sched_f_part_iii_data"].to_csv(
-        f"output_data/990_sched_f_part_iii_data-{now}.csv", index=False
+    args = parser.parse_args(argv)
+    now = datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
+    rows = write_990_data(
+        args.table_name,
+        args.output_dir,
+        now,
+        args.segments,
+        args.endpoint_url,
     )
+    for key, count in rows.items():
+        print(f"{OUTPUTS[key]}: {count} rows")
 
 
 if __name__ == "__main__":
@@ -1,11 +1,12 @@
-import json
+import itertools
 
-import boto3
-import pandas as pd
-
-from .bucket import open_df
+from .blocks import BlockStore
+from .bucket import block_frame_version, open_blocks
+from .cache import get_frame_cache
+from .encoding import ENCODINGS, encode_frame
 from .filing import create_roadmap, extract_from_roadmap
-from .parse import find_pages
+from .metrics import METRICS, recording, stage
+from .parse import find_pages, find_tables_pages
 from .postprocessing import (
     clean_f_i,
     clean_f_ii,
@@ -13,12 +14,15 @@ from .postprocessing import (
     clean_filing,
     postprocess,
 )
-from .setup import load_extractor_df
-from .table import extract_table_data
-from .utils import setup_config, setup_logger
+from .setup import PARSE_DATA_DIR, get_parse_spec
+from .sources import get_source
+from .table import extract_tables
+from .utils import id_page_orientations, setup_config, setup_logger
 
 config = setup_config()
 logger = setup_logger(__name__, config)
+LAZY_PAGES = config.get("PARSE_990_TEXTRACT_LAZY_PAGES", "1") != "0"
+frame_cache = get_frame_cache(config, block_frame_version)
 
 
 def handler(event, context):
@@ -28,107 +32,98 @@ def handler(event, context):
     bucket_name = event.get("bucket_name")
     job_id = event.get("textract_job_id")
     pdf_key = event.get("pdf_key")
+    encoding = event.get("encoding", "records")
 
-    extractor_df = load_extractor_df("parse_data/990_extractors.csv")
-    roadmap_df = pd.read_csv("parse_data/990_roadmap.csv")
-    schedule_f_tablemap_df = pd.read_csv(
-        "parse_data/schedule_f_table_roadmap.csv"
-    )
-    schedule_f_table_extractor_df = pd.read_csv(
-        "parse_data/schedule_f_table_extractors.csv"
-    )
-    schedule_f_row_extractor_df = pd.read_csv(
-        "parse_data/schedule_f_row_extractors.csv"
-    )
+    return {
+        "statusCode": 200,
+        "body": {
+            **parse_filing(get_source(bucket_name), job_id, pdf_key, encoding),
+            "ein": event.get("ein"),
+            "doc_type": event.get("doc_type"),
+            "pdf_key": pdf_key,
+            "bucket_name": bucket_name,
+            "table_name": event.get("table_name"),
+        },
+    }
 
-    PART_I_HEADER = (
-        r"\(a\)\s*Region|\(d\)\s*Activities|\(e\)\s*"
-        r"If activity|\(f\)Total expenditures"
-    )
-    PART_II_HEADER = (
-        r"\(b\)\s*IRS code|\(c\)\s*Region|\(d\)\s*"
-        r"Purpose|\(f\)\s*Manner|\(h\)\s*Description"
-    )
-    PART_III_HEADER = (
-        r"\(b\)\s*Region|\(e\)\s*Manner of cash|\(h\)\s*Method of va"
-    )
-    PART_I_TABLE_NAME = "Activities per Region"
-    PART_II_TABLE_NAME = r"Grants to Organizations Outside the United States"
-    PART_III_TABLE_NAME = "Grants to Individuals Outside the United States"
 
-    bucket = boto3.resource("s3").Bucket(bucket_name)
-    data = open_df(bucket, job_id)
+def parse_filing(
+    source, job_id, pdf_key, encoding="records", spec_dir=PARSE_DATA_DIR
+):
+    """Parse the Textract output for one filing into strings in `encoding`."""
+    with recording() as metrics:
+        with stage("parse_filing", job_id=job_id):
+            result = extract_filing(
+                source, job_id, pdf_key, encoding, spec_dir
+            )
+    if metrics is not None and METRICS == "response":
+        result["metrics"] = metrics.records
+    return result
 
-    lines = data.loc[data["BlockType"] == "LINE"].copy()
-    words = data.loc[data["BlockType"] == "WORD"].copy()
-    pages = lines.groupby("Page")
-    page_map = find_pages(lines)
-    if lines.loc[
-        (lines["Page"] == page_map["Page 1"])
-        & lines["Text"].str.contains(
-            "Net rental income|Direct public|2007 calendar"
-        ),
-        "Page",
-    ].any():
-        raise ValueError("Incorrect form version.")
-    roadmap = create_roadmap(lines, roadmap_df, page_map)
 
-    row = extract_from_roadmap(words, lines, roadmap, extractor_df, page_map)
-    row = postprocess(row, job_id, pdf_key, clean_filing)
+def extract_filing(source, job_id, pdf_key, encoding, spec_dir):
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown output encoding {encoding!r}.")
+    spec = get_parse_spec(spec_dir)
+    part_i, part_ii, part_iii = spec.tables
 
-    part_i_table = extract_table_data(
-        pages,
-        lines,
-        words,
-        PART_I_HEADER,
-        PART_I_TABLE_NAME,
-        schedule_f_tablemap_df,
-        schedule_f_table_extractor_df,
-        schedule_f_row_extractor_df,
-    )
-    part_i_table = postprocess(part_i_table, job_id, pdf_key, clean_f_i)
-    if part_i_table is not None:
-        part_i_table = part_i_table.to_dict()
+    with stage("open_blocks"):
+        store = BlockStore(open_blocks(source, job_id, cache=frame_cache))
 
-    part_ii_table = extract_table_data(
-        pages,
-        lines,
-        words,
-        PART_II_HEADER,
-        PART_II_TABLE_NAME,
-        schedule_f_tablemap_df,
-        schedule_f_table_extractor_df,
-        schedule_f_row_extractor_df,
+    with stage("rotate_lines"):
+        page_orientations = id_page_orientations(store.view("LINE"))
+        store.rotate("LINE", page_orientations)
+    lines = store.view("LINE")
+    page_map = find_pages(lines, spec.pages, spec.old_form)
+    table_pages = find_tables_pages(
+        lines.groupby("Page")["Text"].agg(lambda words: " ".join(words)),
+        spec.tables,
     )
-    part_ii_table = postprocess(part_ii_table, job_id, pdf_key, clean_f_ii)
-    if part_ii_table is not None:
-        part_ii_table = part_ii_table.to_dict()
+    with stage("rotate_words"):
+        if LAZY_PAGES:
+            # Only keep and rotate words on the pages that will be read. The
+            # pages are only known once every part's lines are decoded, so
+            # open_blocks still builds the columns of every word.
+            store.select(
+                "WORD",
+                {*page_map.values(), *itertools.chain(*table_pages.values())},
+            )
+        store.rotate("WORD", page_orientations)
+    # View the lines again, as selecting words replaced the frame
+    lines = store.view("LINE")
+    pages = lines.groupby("Page")
+    words = store.view("WORD")
+    roadmap = create_roadmap(lines, spec.roadmap, page_map)
 
-    part_iii_table = extract_table_data(
+    row = extract_from_roadmap(
+        words, lines, roadmap, spec.extractor_plan, page_map
+    )
+    tables = extract_tables(
         pages,
         lines,
         words,
-        PART_III_HEADER,
-        PART_III_TABLE_NAME,
-        schedule_f_tablemap_df,
-        schedule_f_table_extractor_df,
-        schedule_f_row_extractor_df,
+        spec.tables,
+        spec.tablemap,
+        spec.table_extractors,
+        spec.row_extractors,
+        table_pages=table_pages,
     )
-    part_iii_table = postprocess(part_iii_table, job_id, pdf_key, clean_f_iii)
-    if part_iii_table is not None:
-        part_iii_table = part_iii_table.to_dict()
 
-    return {
-        "statusCode": 200,
-        "body": {
-            "filing_data": json.dumps(row.to_dict()),
-            "part_i_data": json.dumps(part_i_table),
-            "part_ii_data": json.dumps(part_ii_table),
-            "part_iii_data": json.dumps(part_iii_table),
-            "ein": event.get("ein"),
-            "doc_type": event.get("doc_type"),
-            "pdf_key": pdf_key,
-            "bucket_name": bucket_name,
-            "table_name": event.get("table_name"),
-        },
-    }
+    with stage("postprocess"):
+        row = postprocess(row, job_id, pdf_key, clean_filing)
+        part_i_table = postprocess(
+            tables[part_i.name], job_id, pdf_key, clean_f_i
+        )
+        part_ii_table = postprocess(
+            tables[part_ii.name], job_id, pdf_key, clean_f_ii
+        )
+        part_iii_table = postprocess(
+            tables[part_iii.name], job_id, pdf_key, clean_f_iii
+        )
+        return {
+            "filing_data": encode_frame(row, encoding),
+            "part_i_data": encode_frame(part_i_table, encoding),
+            "part_ii_data": encode_frame(part_ii_table, encoding),
+            "part_iii_data": encode_frame(part_iii_table, encoding),
+            "encoding": encoding,
+        }
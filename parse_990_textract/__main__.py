@@ -0,0 +1,85 @@
+import argparse
+import logging
+import sys
+
+from .batch import read_manifest, run_batch
+from .encoding import ENCODINGS
+from .setup import PARSE_DATA_DIR, write_spec_bundle
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m parse_990_textract")
+    commands = parser.add_subparsers(dest="command", required=True)
+    batch = commands.add_parser(
+        "batch", help="Parse the Textract jobs listed in a manifest."
+    )
+    batch.add_argument(
+        "manifest", help="CSV file with job_id, pdf_key and bucket columns"
+    )
+    batch.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="JSON lines file to append results to (default: stdout)",
+    )
+    batch.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: one per CPU)",
+    )
+    batch.add_argument(
+        "--bucket", help="Bucket for manifest rows that do not name one"
+    )
+    batch.add_argument(
+        "--local-dir",
+        help=("Read Textract output from <local-dir>/<bucket>/ instead of S3"),
+    )
+    batch.add_argument(
+        "--encoding",
+        choices=ENCODINGS,
+        default="records",
+        help="Encoding of the parsed tables (default: records)",
+    )
+    batch.add_argument(
+        "--log-level",
+        default="WARNING",
+        help="Level of log messages to print (default: WARNING)",
+    )
+    bundle = commands.add_parser(
+        "bundle",
+        help="Pickle the parse spec so that it loads without the CSVs.",
+    )
+    bundle.add_argument(
+        "parse_data",
+        nargs="?",
+        default=PARSE_DATA_DIR,
+        help="Directory of roadmap and extractor CSVs (default: %(default)s)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "bundle":
+        print(f"Wrote {write_spec_bundle(args.parse_data)}")
+        return 0
+    handler = logging.StreamHandler()
+    handler.setLevel(args.log_level.upper())
+    logging.getLogger().addHandler(handler)
+    jobs = read_manifest(args.manifest, args.bucket)
+    if args.output == "-":
+        failed = run_batch(
+            jobs, sys.stdout, args.workers, args.local_dir, args.encoding
+        )
+    else:
+        with open(args.output, "a") as output:
+            failed = run_batch(
+                jobs, output, args.workers, args.local_dir, args.encoding
+            )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+import csv
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from . import parse_filing
+from .setup import PARSE_DATA_DIR, get_parse_spec
+from .sources import LocalSource, get_source
+from .utils import setup_config, setup_logger
+
+config = setup_config()
+logger = setup_logger(__name__, config)
+
+MANIFEST_COLUMNS = ("job_id", "pdf_key", "bucket")
+# The queue on which a worker process reports the jobs it starts
+started_jobs = None
+
+
+def read_manifest(fname, default_bucket=None):
+    """Read (job_id, pdf_key, bucket) rows from a CSV manifest."""
+    with open(fname, newline="") as f:
+        jobs = []
+        for row in csv.DictReader(f):
+            bucket = row.get("bucket") or default_bucket
+            if not bucket:
+                raise ValueError(f"No bucket given for job {row['job_id']}.")
+            jobs.append((row["job_id"], row["pdf_key"], bucket))
+    return jobs
+
+
+def init_worker(spec_dir, started):
+    """Load the parse spec once when a worker process starts."""
+    global started_jobs
+    started_jobs = started
+    get_parse_spec(spec_dir)
+
+
+def run_started_job(index, *args):
+    """Report job `index` as started, then run it with `run_job`."""
+    started_jobs.put(index)
+    return run_job(*args)
+
+
+@functools.lru_cache(maxsize=None)
+def open_source(bucket_name, local_dir=None):
+    if local_dir is not None:
+        return LocalSource(os.path.join(local_dir, bucket_name))
+    return get_source(bucket_name)
+
+
+def run_job(
+    job_id,
+    pdf_key,
+    bucket_name,
+    local_dir=None,
+    encoding="records",
+    spec_dir=PARSE_DATA_DIR,
+):
+    """Parse one filing, returning an error record instead of raising."""
+    result = {"job_id": job_id, "pdf_key": pdf_key, "bucket_name": bucket_name}
+    start = time.perf_counter()
+    try:
+        source = open_source(bucket_name, local_dir)
+        result.update(
+            parse_filing(source, job_id, pdf_key, encoding, spec_dir),
+            status="ok",
+        )
+    except Exception as e:
+        logger.error(f"Failed to parse job {job_id}: {e!r}")
+        result.update(
+            status="error",
+            error=repr(e),
+            traceback=traceback.format_exc(),
+        )
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def crashed_job(job_id, pdf_key, bucket_name, error):
+    """Return the error record of a job whose worker process died."""
+    return {
+        "job_id": job_id,
+        "pdf_key": pdf_key,
+        "bucket_name": bucket_name,
+        "status": "error",
+        "error": repr(error),
+        "seconds": None,
+    }
+
+
+def drain(queue):
+    """Return the set of items waiting in a SimpleQueue."""
+    items = set()
+    while not queue.empty():
+        items.add(queue.get())
+    return items
+
+
+def run_pool(pending, indexes, write, max_workers, spec_dir, *args):
+    """Run some `pending` jobs in one pool; return its crash and what ran."""
+    started = multiprocessing.SimpleQueue()
+    running = set()
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_worker,
+        initargs=(spec_dir, started),
+    ) as executor:
+        futures = {
+            executor.submit(
+                run_started_job, index, *pending[index], *args, spec_dir
+            ): index
+            for index in indexes
+        }
+        crash = None
+        for future in as_completed(futures):
+            # Keep the queue short, so workers never block on it
+            running |= drain(started)
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                crash = e
+                continue
+            del pending[futures[future]]
+            write(result)
+    return crash, (running | drain(started)) & pending.keys()
+
+
+def run_batch(
+    jobs,
+    output,
+    max_workers=None,
+    local_dir=None,
+    encoding="records",
+    spec_dir=PARSE_DATA_DIR,
+    progress=sys.stderr,
+):
+    """Parse `jobs` in a process pool, writing each result as it finishes."""
+    failed = 0
+    done = 0
+
+    def write(result):
+        nonlocal failed, done
+        done += 1
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        if result["status"] != "ok":
+            failed += 1
+        if progress is not None:
+            seconds = result["seconds"]
+            print(
+                f"[{done}/{len(jobs)}] {result['job_id']}: {result['status']}"
+                + (f" in {seconds}s" if seconds is not None else "")
+                + f" ({failed} failed)",
+                file=progress,
+                flush=True,
+            )
+
+    pending = dict(enumerate(jobs))
+    # Jobs that were running when a worker died, e.g. out of memory
+    suspects = set()
+    while pending:
+        # Rerun suspects one at a time, so a crash names the job causing it
+        isolated = sorted(suspects & pending.keys())
+        crash, running = run_pool(
+            pending,
+            isolated or list(pending),
+            write,
+            1 if isolated else max_workers,
+            spec_dir,
+            local_dir,
+            encoding,
+        )
+        if crash is None:
+            continue
+        logger.error(
+            f"A worker process died running jobs {sorted(running)}: {crash!r}"
+        )
+        if isolated or not running:
+            # A lone job crashed its worker, or no worker could start at all
+            for index in sorted(running or pending):
+                write(crashed_job(*pending.pop(index), crash))
+        else:
+            suspects |= running
+    return failed
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from .utils import rotate_blocks, setup_config, setup_logger
+
+config = setup_config()
+logger = setup_logger(__name__, config)
+
+BLOCK_TYPES = ("LINE", "WORD")
+PIPELINE_COLUMNS = (
+    "BlockType",
+    "Page",
+    "Text",
+    "Left",
+    "Top",
+    "Right",
+    "Bottom",
+    "Midpoint_X",
+    "Midpoint_Y",
+    "Height",
+    "Width",
+    "Orientation",
+)
+
+
+class BlockStore:
+    """A filing's blocks in one frame, sorted by block type and page."""
+
+    def __init__(
+        self, blocks, block_types=BLOCK_TYPES, columns=PIPELINE_COLUMNS
+    ):
+        type_codes = pd.Categorical(
+            blocks["BlockType"], categories=block_types
+        ).codes
+        pages = blocks["Page"].to_numpy()
+        keep = np.flatnonzero(type_codes >= 0)
+        keep = keep[np.lexsort((pages[keep], type_codes[keep]))]
+        self.frame = pd.DataFrame(
+            {column: blocks[column].array.take(keep) for column in columns}
+        )
+        self.block_types = block_types
+        keys = np.column_stack([type_codes[keep], pages[keep]])
+        starts = np.flatnonzero(
+            np.concatenate([[True], (keys[1:] != keys[:-1]).any(axis=1)])
+        )
+        ends = np.append(starts[1:], len(keep))
+        self.ranges = {
+            (block_types[code], page): (start, end)
+            for ((code, page), start, end) in zip(keys[starts], starts, ends)
+        }
+
+    def bounds(self, block_type, page=None):
+        """Return the (start, end) rows of a block type, or of one page."""
+        if page is not None:
+            return self.ranges.get((block_type, page), (0, 0))
+        spans = [
+            span
+            for ((span_type, _page), span) in self.ranges.items()
+            if span_type == block_type
+        ]
+        if not spans:
+            return 0, 0
+        return spans[0][0], spans[-1][1]
+
+    def view(self, block_type, page=None):
+        """Return the blocks of a type, or of one page, sorted by page."""
+        start, end = self.bounds(block_type, page)
+        # A slice of the frame, not a copy, so treat it as read-only
+        return self.frame.iloc[start:end]
+
+    def pages(self, block_type):
+        """Return the pages with blocks of a type, in order."""
+        return [
+            page
+            for (span_type, page) in self.ranges
+            if span_type == block_type
+        ]
+
+    def select(self, block_type, pages):
+        """Drop the blocks of a type that are not on one of `pages`."""
+        spans = {
+            key: span
+            for (key, span) in self.ranges.items()
+            if key[0] != block_type or key[1] in pages
+        }
+        keep = np.concatenate(
+            [np.arange(start, end) for (start, end) in spans.values()]
+            or [np.array([], dtype=int)]
+        )
+        # Views taken before this keep the old frame alive
+        self.frame = self.frame.take(keep).reset_index(drop=True)
+        ends = np.cumsum([end - start for (start, end) in spans.values()])
+        self.ranges = {
+            key: (end - (span[1] - span[0]), end)
+            for ((key, span), end) in zip(spans.items(), ends)
+        }
+
+    def rotate(self, block_type, page_orientations):
+        """Rotate the blocks of a type on every page, in place."""
+        orientations = np.zeros(len(self.frame), dtype=int)
+        for page in self.pages(block_type):
+            start, end = self.ranges[(block_type, page)]
+            orientations[start:end] = page_orientations.get(page, 0)
+        rotate_blocks(self.frame, orientations)
@@ -1,27 +1,30 @@
-import io
-import json
-import logging
-import os
+import array
+import math
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
-from dotenv import dotenv_values
 
-from .utils import rotate_pages
+from . import stream
+from .cache import source_version
+from .stream import iter_blocks
+from .utils import get_orientation, rotate_pages, setup_config, setup_logger
+
+config = setup_config()
+logger = setup_logger(__name__, config)
+DOWNLOAD_WORKERS = int(config.get("PARSE_990_TEXTRACT_DOWNLOAD_WORKERS", 8))
 
-config = dotenv_values(os.getenv("ENVFILE", ".env.local"))
-logger = logging.getLogger(__name__)
-logger.setLevel(
-    getattr(
-        logging, config.get("PARSE_990_TEXTRACT_OUTPUT_LOG_LEVEL", "DEBUG")
-    )
-)
 
+def get_bucket(bucket_name, max_workers=DOWNLOAD_WORKERS):
+    """Return S3 bucket whose client pools enough connections for workers."""
+    # boto3 is slow to import and only needed for S3 sources
+    import boto3
+    from botocore.config import Config
 
-def get_json(bucket, obj_key):
-    json_file = io.BytesIO()
-    bucket.download_fileobj(obj_key, json_file)
-    json_file.seek(0)
-    return json.load(io.StringIO(json_file.read().decode("utf-8")))["Blocks"]
+    s3 = boto3.resource(
+        "s3", config=Config(max_pool_connections=max(max_workers, 10))
+    )
+    return s3.Bucket(bucket_name)
 
 
 def strip_prefix(key, prefix):
@@ -29,82 +32,144 @@ def strip_prefix(key, prefix):
     return key[pref_len:]
 
 
-def get_records(
-    bucket,
+def read_parts(
+    source,
     job_id,
     prefix,
-    limit=1000,
+    read,
     exclude=(".s3_access_check",),
-    marker=None,
+    max_workers=DOWNLOAD_WORKERS,
 ):
-    if marker is None:
-        logger.info(
-            f"Extracting records for job {job_id} from bucket {bucket.name}"
-        )
-        json_objects = bucket.objects.filter(
-            Prefix=f"{prefix}/{job_id}", MaxKeys=limit
-        )
+    """Return `read(source, key)` for each Textract output part of a job."""
+    logger.info(f"Extracting records for job {job_id} from {source}")
+    job_prefix = f"{prefix}/{job_id}/"
+    keys = [
+        key
+        for key in source.list_keys(job_prefix)
+        if strip_prefix(key, job_prefix) not in exclude
+    ]
+    if not keys:
+        raise FileNotFoundError(f"No Textract output for job {job_id}.")
+    if max_workers > 1 and len(keys) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields results in key order, so blocks stay in order
+            parts = list(executor.map(lambda key: read(source, key), keys))
     else:
-        logger.info(
-            f"Extracting records for job {job_id} from bucket {bucket.name}"
-            f" starting at object {marker}"
-        )
-        json_objects = bucket.objects.filter(
-            Prefix=f"{prefix}/{job_id}", Marker=marker, MaxKeys=limit
-        )
-    combined = []
-    last_key = ""
-    for obj_count, json_obj in enumerate(json_objects):  # noqa: B007
-        if strip_prefix(json_obj.key, f"{prefix}/{job_id}/") not in exclude:
-            combined.extend(get_json(bucket, json_obj.key))
-        last_key = json_obj.key
-    logger.info(f"Extracted records from {obj_count} objects.")
-    if obj_count > 999:
-        combined += get_records(bucket, job_id, marker=last_key)
-    return combined
-
-
-def open_df(bucket, job_id, prefix="textract-output"):
-    logger.info(f"Opening dataframe for job {job_id} from bucket {bucket}")
-    records = get_records(bucket, job_id, prefix)
-    df = pd.DataFrame.from_records(
-        records,
-        index="Id",
-        exclude=[
-            "ColumnIndex",
-            "ColumnSpan",
-            "DocumentType",
-            "EntityTypes",
-            "Hint",
-            "Query",
-            "SelectionStatus",
-            "RowIndex",
-            "RowSpan",
-        ],
-    ).assign(
-        Polygon=lambda df: df["Geometry"].map(lambda x: x["Polygon"]),
-        Height=lambda df: df["Geometry"].map(
-            lambda x: x["BoundingBox"]["Height"]
-        ),
-        Left=lambda df: df["Geometry"].map(lambda x: x["BoundingBox"]["Left"]),
-        Top=lambda df: df["Geometry"].map(lambda x: x["BoundingBox"]["Top"]),
-        Right=lambda df: df["Polygon"].map(
-            lambda polygon: max(corner["X"] for corner in polygon)
-        ),
-        Bottom=lambda df: df["Polygon"].map(
-            lambda polygon: max(corner["Y"] for corner in polygon)
-        ),
-        Midpoint_X=lambda df: (df["Left"] + df["Right"]) / 2,
-        Midpoint_Y=lambda df: (df["Top"] + df["Bottom"]) / 2,
-        Width=lambda df: df["Geometry"].map(
-            lambda x: x["BoundingBox"]["Width"]
-        ),
-        Children=lambda df: df["Relationships"].map(
-            lambda x: x[0]["Ids"] if x is not None else x
-        ),
-        Line_No=lambda df: pd.qcut(
-            df["Top"], 100, labels=list(range(100))
-        ).astype(int),
-        File=job_id,
+        parts = [read(source, key) for key in keys]
+    logger.info(f"Extracted records from {len(keys)} objects.")
+    return parts
+
+
+def read_block_frame(source, key):
+    """Return the blocks in a Textract output part as a frame, as streamed."""
+    body = source.open(key)
+    try:
+        return block_columns(iter_blocks(body))
+    finally:
+        body.close()
+
+
+def block_columns(blocks):
+    """Return the columns of a block frame read from `blocks`."""
+    ids, block_types, texts, children = [], [], [], []
+    pages = array.array("i")
+    confidence, left, top, width, height, right, bottom, edge_x, edge_y = (
+        array.array("f") for _ in range(9)
+    )
+    # Copy geometry into arrays as blocks are read, so that no Geometry,
+    # Polygon or Relationships objects outlive the loop
+    for block in blocks:
+        ids.append(block["Id"])
+        block_types.append(block["BlockType"])
+        texts.append(block.get("Text"))
+        pages.append(block.get("Page", 1))
+        confidence.append(block.get("Confidence", math.nan))
+        box = block["Geometry"]["BoundingBox"]
+        polygon = block["Geometry"]["Polygon"]
+        left.append(box["Left"])
+        top.append(box["Top"])
+        width.append(box["Width"])
+        height.append(box["Height"])
+        right.append(max(corner["X"] for corner in polygon))
+        bottom.append(max(corner["Y"] for corner in polygon))
+        edge_x.append(polygon[1]["X"] - polygon[0]["X"])
+        edge_y.append(polygon[1]["Y"] - polygon[0]["Y"])
+        relationships = block.get("Relationships")
+        children.append(relationships[0]["Ids"] if relationships else None)
+
+    def float32(values):
+        return np.frombuffer(values, dtype=np.float32)
+
+    return pd.DataFrame(
+        {
+            "BlockType": block_types,
+            "Confidence": float32(confidence),
+            "Text": texts,
+            "Page": np.frombuffer(pages, dtype=np.int32),
+            "Height": float32(height),
+            "Left": float32(left),
+            "Top": float32(top),
+            "Right": float32(right),
+            "Bottom": float32(bottom),
+            "Midpoint_X": (float32(left) + float32(right)) / 2,
+            "Midpoint_Y": (float32(top) + float32(bottom)) / 2,
+            "Width": float32(width),
+            "Orientation": get_orientation(float32(edge_x), float32(edge_y)),
+            "Children": children,
+        },
+        index=pd.Index(ids, name="Id"),
+    )
+
+
+def finish_block_frame(df, job_id):
+    """Add the columns that depend on every block in the job."""
+    df["BlockType"] = pd.Categorical(df["BlockType"])
+    df["Line_No"] = pd.qcut(df["Top"], 100, labels=False).astype(np.int8)
+    df["File"] = job_id
+    return df
+
+
+def block_frame_version():
+    """Return a version key that changes with the code deriving frames."""
+    return source_version(
+        stream,
+        block_columns,
+        finish_block_frame,
+        get_orientation,
+        open_blocks,
+    )
+
+
+def open_blocks(
+    source,
+    job_id,
+    prefix="textract-output",
+    max_workers=DOWNLOAD_WORKERS,
+    cache=None,
+):
+    """Return a job's blocks sorted by page, before any rotation."""
+    if cache is not None and (df := cache.get(job_id)) is not None:
+        return df
+    logger.info(f"Opening dataframe for job {job_id} from {source}")
+    # Each part is read straight into a frame, so no part's blocks are
+    # held as dicts while the others are read
+    parts = read_parts(
+        source, job_id, prefix, read_block_frame, max_workers=max_workers
+    )
+    df = finish_block_frame(pd.concat(parts), job_id).sort_values(by="Page")
+    if cache is not None:
+        cache.put(job_id, df)
+    return df
+
+
+def open_df(
+    source,
+    job_id,
+    prefix="textract-output",
+    max_workers=DOWNLOAD_WORKERS,
+    cache=None,
+):
+    """Return a job's blocks sorted by page, rotated to reading order."""
+    return rotate_pages(
+        open_blocks(source, job_id, prefix, max_workers, cache)
     )
-    return rotate_pages(df).sort_values(by="Page")
@@ -0,0 +1,118 @@
+import hashlib
+import inspect
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .utils import setup_config, setup_logger
+
+config = setup_config()
+logger = setup_logger(__name__, config)
+
+DEFAULT_MAX_BYTES = 2**30
+SUFFIX = ".pkl"
+
+
+def source_version(*funcs):
+    """Return a short digest of `funcs`' source and pandas/NumPy versions."""
+    # Pickled frames may not load under another pandas or NumPy
+    digest = hashlib.sha1(f"{pd.__version__} {np.__version__}".encode())
+    for func in funcs:
+        digest.update(inspect.getsource(func).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class FrameCache:
+    """Size-bounded LRU cache of DataFrames stored as files in a directory."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, version=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        safe_key = re.sub(r"[^\w.-]", "_", str(key))
+        return os.path.join(
+            self.directory, f"{safe_key}-{self.version}{SUFFIX}"
+        )
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            df = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # Any error unpickling, e.g. from another pandas, is a miss
+            logger.error(f"Dropping unreadable cache entry {path}: {e}")
+            self.remove(path)
+            return None
+        # Reading an entry makes it the most recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Another process evicted it after we read it
+            pass
+        logger.info(f"Loaded {key} from cache")
+        return df
+
+    def put(self, key, df):
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix=".tmp", delete=False
+        ) as tmp:
+            tmp_path = tmp.name
+        try:
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, self.path(key))
+        except OSError as e:
+            logger.error(f"Could not cache {key}: {e}")
+            self.remove(tmp_path)
+            return
+        self.evict()
+
+    def entries(self):
+        """Return (current, mtime, size, path) per entry, stalest first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            # Entries of other versions are never read, so evict them first
+            current = entry.name.endswith(f"-{self.version}{SUFFIX}")
+            entries.append((current, stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for (_current, _mtime, size, _path) in entries)
+        for _current, _mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def get_frame_cache(config, get_version):
+    """Return the cache configured in `config`, or None if it is disabled."""
+    directory = config.get("PARSE_990_TEXTRACT_CACHE_DIR")
+    if not directory:
+        return None
+    max_bytes = int(
+        config.get("PARSE_990_TEXTRACT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+    )
+    # Only hash the source for the version if the cache is enabled
+    return FrameCache(directory, max_bytes, get_version())
@@ -0,0 +1,55 @@
+import base64
+import gzip
+import json
+
+import pandas as pd
+
+from .postprocessing import to_dict
+
+ENCODINGS = ("records", "columns", "columns.gz")
+
+
+def to_columns(df):
+    """Return `df` as a header of column names and a list per column."""
+    # As with DataFrame.to_dict(), the last of any duplicate columns wins
+    df = df.loc[:, ~df.columns.duplicated(keep="last")]
+    df = df.astype(object).where(df.notna(), None)
+    return {
+        "columns": df.columns.tolist(),
+        "data": [df.iloc[:, i].tolist() for i in range(df.shape[1])],
+    }
+
+
+def encode_frame(df, encoding="records"):
+    """Serialize a parsed table (or None) to a string in `encoding`."""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown output encoding {encoding!r}.")
+    if df is None:
+        return json.dumps(None)
+    if encoding == "records":
+        return json.dumps(to_dict(df))
+    payload = json.dumps(to_columns(df), separators=(",", ":"))
+    if encoding == "columns":
+        return payload
+    return base64.b64encode(gzip.compress(payload.encode("utf-8"))).decode(
+        "ascii"
+    )
+
+
+def decode_frame(data, encoding="records"):
+    """Return the table in `data`, as encoded by encode_frame, or None."""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown output encoding {encoding!r}.")
+    # A missing table is JSON null in every encoding
+    if not data or data == "null":
+        return None
+    if encoding == "columns.gz":
+        data = gzip.decompress(base64.b64decode(data))
+    # DynamoDB may hold the already-parsed JSON
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data)
+    if encoding == "records":
+        return pd.DataFrame.from_dict(data)
+    df = pd.DataFrame(dict(enumerate(data["data"])))
+    df.columns = data["columns"]
+    return df
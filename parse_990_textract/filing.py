@@ -1,63 +1,62 @@
+import numpy as np
 import pandas as pd
 
-from .parse import create_extractors, find_item
-from .utils import setup_config, setup_logger, sort_words
+from .metrics import stage, timed
+from .models import PageIndex
+from .parse import add_corners, find_items, resolve_boxes
+from .utils import setup_config, setup_logger
 
 config = setup_config()
 logger = setup_logger(__name__, config)
 
 
+@timed("create_roadmap")
 def create_roadmap(lines, roadmap_df, page_map):
     """Create mapping of coordinates and landmarks from CSV and page map."""
     logger.info("Creating roadmap")
-    roadmap = pd.concat(
-        roadmap_df.apply(
-            lambda row: find_item(
-                row["landmark"],
-                lines,
-                page_map[row["page"]],
-                row["regex"],
-                row["left_default"],
-                row["top_default"],
-                row["x_tolerance"],
-                row["y_tolerance"],
-            ).assign(
-                Item=row["landmark"],
-                Top_Default=row["top_default"],
-                Left_Default=row["left_default"],
-            ),
-            axis=1,
-        ).values
-    )
-    return pd.concat(
-        [
-            roadmap,
-            pd.DataFrame(
-                {
-                    "Item": ["Top Left Corner", "Bottom Right Corner"],
-                    "Top": [0, 1],
-                    "Left": [0, 1],
-                    "Top_Default": [0, 1],
-                    "Left_Default": [0, 1],
-                }
-            ),
-        ]
-    ).set_index("Item")
-
-
-def extract_from_roadmap(words, lines, roadmap, extractor_df, page_map):
-    page_words = {
-        page_no: words.loc[index].assign(WordIndex=lambda df: sort_words(df))
-        for (page_no, index) in words.groupby("Page").groups.items()
-    }
-    page_lines = {
-        page_no: lines.loc[index].assign(WordIndex=lambda df: sort_words(df))
-        for (page_no, index) in lines.groupby("Page").groups.items()
+    roadmap = find_items(lines, roadmap_df, roadmap_df["page"].map(page_map))
+    return add_corners(roadmap)
+
+
+@timed("extract_from_roadmap")
+def extract_from_roadmap(words, lines, roadmap, plan, page_map):
+    """Extract every field in `plan` from the words or lines in its box."""
+    page_nos = np.array([page_map[label] for label in plan.page_labels])[
+        plan.page_codes
+    ]
+    boxes = resolve_boxes(plan, roadmap)
+    # Only the pages that extractors read are sorted and indexed
+    pages = set(page_nos[page_nos != 0])
+    indexes = {
+        "words": PageIndex.by_page(words, pages),
+        "lines": PageIndex.by_page(lines, pages),
     }
-    extractors = create_extractors(extractor_df, roadmap, page_map)
-    return pd.Series(
-        extractors.map(
-            lambda extractor: extractor.extract(page_words, page_lines)
-        ).values,
-        index=extractor_df["field_name"],
-    )
+    texts = np.full(len(page_nos), "", dtype=object)
+    for (strategy, page_no), rows in (
+        pd.DataFrame({"strategy": plan.strategies, "page": page_nos})
+        .groupby(["strategy", "page"])
+        .indices.items()
+    ):
+        index = indexes[strategy].get(page_no)
+        if page_no and index is not None:
+            texts[rows] = index.get_texts(boxes[rows])
+    with stage("match_fields"):
+        return match_fields(plan, texts)
+
+
+def match_fields(plan, texts):
+    """Return each field's `match` group in the text of its box."""
+    results = np.full(len(texts), "", dtype=object)
+    has_text = texts != ""
+    misses = {}
+    for code, regex in enumerate(plan.regexes):
+        rows = np.flatnonzero((plan.regex_codes == code) & has_text)
+        for row, match in zip(rows, map(regex.search, texts[rows])):
+            if match is None:
+                misses[plan.names[row]] = texts[row]
+            else:
+                results[row] = match.group("match")
+    if misses:
+        logger.error(f"No match for {len(misses)} fields: {list(misses)}")
+        logger.debug(f"Text of the unmatched fields' boxes: {misses}")
+    return pd.Series(results, index=pd.Index(plan.names, name="field_name"))
@@ -0,0 +1,115 @@
+import contextlib
+import contextvars
+import functools
+import json
+import resource
+import threading
+import time
+import tracemalloc
+
+from .utils import setup_config, setup_logger
+
+config = setup_config()
+logger = setup_logger(__name__, config)
+
+# "off", "log" to log each stage, or "response" to also return them
+METRICS = config.get("PARSE_990_TEXTRACT_METRICS", "off")
+TRACE_MEMORY = config.get("PARSE_990_TEXTRACT_TRACE_MEMORY", "0") == "1"
+NO_STAGE = contextlib.nullcontext()
+MB = 2**20
+
+current = contextvars.ContextVar("metrics", default=None)
+
+
+class Metrics:
+    """Wall time, CPU time and memory use of named pipeline stages."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.open = []
+        self.lock = threading.Lock()
+
+    def stage(self, name, **labels):
+        record = {"stage": name, **labels}
+        return self.measure(record)
+
+    @contextlib.contextmanager
+    def measure(self, record):
+        if self.trace_memory:
+            with self.lock:
+                self.fold_peak()
+                tracemalloc.reset_peak()
+                record["start_bytes"] = tracemalloc.get_traced_memory()[0]
+                record["peak_bytes"] = record["start_bytes"]
+                self.open.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 6)
+            # CPU time is the whole process's, including other threads
+            record["cpu_s"] = round(time.process_time() - cpu, 6)
+            record["max_rss_mb"] = round(max_rss() / MB, 1)
+            if self.trace_memory:
+                with self.lock:
+                    self.fold_peak()
+                    self.open.remove(record)
+                start = record.pop("start_bytes")
+                peak = record.pop("peak_bytes")
+                record["peak_alloc_mb"] = round((peak - start) / MB, 3)
+            self.records.append(record)
+            logger.info(json.dumps({"metric": "stage", **record}))
+
+    def fold_peak(self):
+        """Credit the peak since the last reset to every open stage."""
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open:
+            record["peak_bytes"] = max(record["peak_bytes"], peak)
+
+
+def max_rss():
+    """Return the maximum resident set size of the process in bytes."""
+    # Linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextlib.contextmanager
+def recording(enabled=METRICS != "off", trace_memory=TRACE_MEMORY):
+    """Record the stages run in this context, yielding the Metrics or None."""
+    if not enabled:
+        yield None
+        return
+    metrics = Metrics(trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def stage(name, **labels):
+    """Return a context manager that records a stage, if recording."""
+    metrics = current.get()
+    if metrics is None:
+        return NO_STAGE
+    return metrics.stage(name, **labels)
+
+
+def timed(name):
+    """Decorate a function to record each call as a stage."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,16 +1,14 @@
 import dataclasses
-import re
 
+import numpy as np
 import pandas as pd
 
 from .utils import (
-    cluster_words,
-    columnize,
-    combine_row,
+    at_precision,
+    cluster_labels,
     find_crossing_right,
-    get_cluster_coords,
     get_coordinate,
-    get_regex,
+    reading_order,
     setup_config,
     setup_logger,
 )
@@ -19,63 +17,132 @@ config = setup_config()
 logger = setup_logger(__name__, config)
 
 
-@dataclasses.dataclass
-class BoundingBox:
-    left: int
-    left_delta: int
-    top: int
-    top_delta: int
-    right: int
-    right_delta: int
-    bottom: int
-    bottom_delta: int
-
-    def get_text_in_box(self, text, page_no):
-        page_text = text[page_no].sort_values(by="WordIndex")
-        text_in_box = page_text.loc[
-            lambda df: (
-                df["Midpoint_X"].between(
-                    self.left + self.left_delta, self.right + self.right_delta
-                )
-                & df["Midpoint_Y"].between(
-                    self.top + self.top_delta, self.bottom + self.bottom_delta
-                )
-            ),
-            "Text",
-        ].agg(lambda x: " ".join(x.values))
-        if not any(text_in_box):
-            return ""
-        return text_in_box
+class PageIndex:
+    """Text blocks on one page, indexed for bounding box lookups."""
 
+    def __init__(self, blocks):
+        # Sorted by Midpoint_Y, so a box's rows are found by binary search
+        blocks = blocks.sort_values(by="Midpoint_Y", kind="stable")
+        self.midpoint_x = blocks["Midpoint_X"].to_numpy()
+        self.midpoint_y = blocks["Midpoint_Y"].to_numpy()
+        self.word_index = blocks["WordIndex"].to_numpy()
+        self.text = blocks["Text"].to_numpy(dtype=object)
 
-@dataclasses.dataclass
-class Extractor:
-    name: str
-    strategy: str
-    page: int
-    bounding_box: BoundingBox
-    regex: re.Pattern
-
-    def extract(self, words, lines):
-        if not self.page:
-            return ""
-        if self.strategy == "words":
-            words_in_box = self.bounding_box.get_text_in_box(
-                words,
-                self.page,
-            )
-        elif self.strategy == "lines":
-            words_in_box = self.bounding_box.get_text_in_box(
-                lines,
-                self.page,
+    @classmethod
+    def by_page(cls, blocks, pages):
+        """Return a PageIndex for each of `pages`, keyed by page number."""
+        blocks = reading_order(blocks.loc[blocks["Page"].isin(pages)])
+        arrays = (
+            blocks["Midpoint_X"].to_numpy(),
+            blocks["Midpoint_Y"].to_numpy(),
+            blocks["WordIndex"].to_numpy(),
+            blocks["Text"].to_numpy(dtype=object),
+        )
+        page_nos, starts = np.unique(
+            blocks["Page"].to_numpy(), return_index=True
+        )
+        ends = np.append(starts[1:], len(blocks))
+        indexes = {}
+        for page_no, start, end in zip(page_nos, starts, ends):
+            index = indexes[page_no] = cls.__new__(cls)
+            (
+                index.midpoint_x,
+                index.midpoint_y,
+                index.word_index,
+                index.text,
+            ) = (array[start:end] for array in arrays)
+        return indexes
+
+    def get_text(self, left, right, top, bottom):
+        """Join text of blocks whose midpoints fall inside the box."""
+        return self.get_texts(np.array([[left, right, top, bottom]]))[0]
+
+    def get_texts(self, boxes):
+        """Return `get_text` for each (left, right, top, bottom) row."""
+        boxes = at_precision(boxes, self.midpoint_y)
+        left, right, top, bottom = boxes.T
+        starts = self.midpoint_y.searchsorted(top, side="left")
+        ends = self.midpoint_y.searchsorted(bottom, side="right")
+        missing = np.isnan(boxes).any(axis=1)
+        texts = []
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            if missing[i]:
+                texts.append("")
+                continue
+            midpoint_x = self.midpoint_x[start:end]
+            in_box = (midpoint_x >= left[i]) & (midpoint_x <= right[i])
+            if not in_box.any():
+                texts.append("")
+                continue
+            word_index = self.word_index[start:end][in_box]
+            text = self.text[start:end][in_box]
+            texts.append(" ".join(text[word_index.argsort(kind="stable")]))
+        return texts
+
+
+class TableCells:
+    """Words of a table assigned to (cluster, column) cells."""
+
+    def __init__(self, words, clusters, col_spans):
+        # `words` must be sorted by cluster, with `clusters` their ids
+        right = words["Right"].to_numpy()
+        lefts, rights = (
+            at_precision(bounds, right) for bounds in zip(*col_spans)
+        )
+        # A word is in every column span (left, right] holding its right edge
+        word_idx, col_idx = np.nonzero(
+            (right[:, np.newaxis] > lefts) & (right[:, np.newaxis] <= rights)
+        )
+        self.n_clusters = clusters.max() + 1
+        self.n_cols = len(lefts)
+        cell = clusters[word_idx] * self.n_cols + col_idx
+        n_cells = self.n_clusters * self.n_cols
+        shape = (self.n_clusters, self.n_cols)
+        self.nonempty = (np.bincount(cell, minlength=n_cells) > 0).reshape(
+            shape
+        )
+        cell_top = np.full(n_cells, np.inf)
+        np.minimum.at(cell_top, cell, words["Top"].to_numpy(float)[word_idx])
+        cell_bottom = np.full(n_cells, np.inf)
+        np.minimum.at(
+            cell_bottom, cell, words["Bottom"].to_numpy(float)[word_idx]
+        )
+        has_words = self.nonempty.any(axis=1)
+        self.top = np.where(
+            has_words, cell_top.reshape(shape).min(axis=1), np.nan
+        )
+        self.bottom = np.where(
+            has_words,
+            np.where(self.nonempty, cell_bottom.reshape(shape), -np.inf).max(
+                axis=1
+            ),
+            np.nan,
+        )
+        self.text = self.join_cells(words, word_idx, cell, n_cells).reshape(
+            shape
+        )
+
+    @staticmethod
+    def join_cells(words, word_idx, cell, n_cells):
+        """Join each cell's text from left to right."""
+        order = np.lexsort((words["Left"].to_numpy()[word_idx], cell))
+        cell = cell[order]
+        text = words["Text"].to_numpy(dtype=object)[word_idx[order]]
+        cell_text = np.full(n_cells, "", dtype=object)
+        starts = np.flatnonzero(np.diff(cell, prepend=-1))
+        for start, end in zip(starts, np.append(starts[1:], len(cell))):
+            cell_text[cell[start]] = " ".join(
+                word if isinstance(word, str) else ""
+                for word in text[start:end]
             )
-        if not any(words_in_box):
-            return ""
-        result = get_regex(words_in_box, self.regex, "match", "NO MATCH")
-        if result == "NO MATCH":
-            logger.error(f"No match for {self.name} in {words_in_box}")
-            return ""
-        return result
+        return cell_text
+
+    def join_row(self, clusters):
+        """Combine clusters into one row of column text."""
+        return [
+            "".join(f"{text} " for text in column).strip()
+            for column in self.text[clusters].T
+        ]
 
 
 @dataclasses.dataclass
@@ -214,70 +281,54 @@ class TableExtractor:
         y_tol = table_words["Height"].median()
         if not table_words.shape[0]:
             return []
-        word_clusters = cluster_words(
+        clusters = cluster_labels(
             table_words,
             table_words["Height"].min(),
             "Midpoint_Y",
         )
-        col_spans = self.get_col_spans(words, page)
-        columnized = columnize(word_clusters[0], col_spans)
-        columnized.index = self.fields
-        last_cluster_coords = pd.DataFrame.from_records(
-            columnized.map(get_cluster_coords)
+        cells = TableCells(
+            table_words.loc[clusters.index],
+            clusters.values,
+            self.get_col_spans(words, page),
         )
+        numeric = np.isin(np.arange(cells.n_cols), self.numeric_cols or ())
         rows = []
-        current_row = [columnized]
-        top_ws = last_cluster_coords["Top"].min() - self.get_table_top(
-            words, page
-        )
+        current_row = [0]
+        top_ws = cells.top[0] - self.get_table_top(words, page)
         if top_ws > y_tol * 4:
             alignment = "BOTTOM"
         else:
             alignment = "UNKNOWN"
-        for cluster in word_clusters[1:]:
-            columnized = columnize(cluster, col_spans)
-            columnized.index = self.fields
-            cluster_coords = pd.DataFrame.from_records(
-                columnized.map(get_cluster_coords)
-            )
-            nonempty = cluster_coords.dropna().index.to_series()
-            last_nonempty = last_cluster_coords.dropna().index.to_series()
-            more_cols = (~nonempty.isin(last_nonempty)).any()
-            less_cols = (~last_nonempty.isin(nonempty)).any()
-            both_numeric = (
-                nonempty.isin(self.numeric_cols)
-                & last_nonempty.isin(self.numeric_cols)
-            ).any()
-            y_delta = (
-                cluster_coords["Top"].min()
-                - last_cluster_coords["Bottom"].max()
-            )
+        for cluster in range(1, cells.n_clusters):
+            nonempty = cells.nonempty[cluster]
+            last_nonempty = cells.nonempty[cluster - 1]
+            more_cols = (nonempty & ~last_nonempty).any()
+            less_cols = (last_nonempty & ~nonempty).any()
+            both_numeric = (nonempty & last_nonempty & numeric).any()
+            y_delta = cells.top[cluster] - cells.bottom[cluster - 1]
             if (
                 both_numeric
                 or (more_cols and (alignment == "TOP"))
                 or (less_cols and (alignment == "BOTTOM"))
                 or (y_delta > y_tol)
             ):
-                combined_row = combine_row(current_row)
-                rows.append(combined_row)
-                current_row = [columnized]
+                rows.append(cells.join_row(current_row))
+                current_row = [cluster]
             elif less_cols and (alignment == "UNKNOWN"):
                 alignment = "TOP"
-                current_row.append(columnized)
+                current_row.append(cluster)
             elif more_cols and (alignment == "UNKNOWN"):
                 alignment = "BOTTOM"
-                current_row.append(columnized)
+                current_row.append(cluster)
             else:
-                current_row.append(columnized)
-            last_cluster_coords = cluster_coords
-        combined_row = combine_row(current_row)
-        rows.append(combined_row)
+                current_row.append(cluster)
+        rows.append(cells.join_row(current_row))
         return rows
 
     def extract_rows(self, words, page):
 
         rows = self.get_rows(words, page)
-        non_empty_rows = [row for row in rows if row.any()]
+        non_empty_rows = [row for row in rows if any(row)]
         if non_empty_rows:
             return pd.DataFrame(non_empty_rows, columns=self.fields)
         return pd.NA
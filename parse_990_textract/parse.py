@@ -1,68 +1,72 @@
+import re
+
+import numpy as np
 import pandas as pd
 
-from .models import BoundingBox, Extractor
-from .utils import get_coordinate, setup_config, setup_logger
+from .metrics import timed
+from .setup import CORNERS
+from .utils import at_precision, setup_config, setup_logger
 
 config = setup_config()
 logger = setup_logger(__name__, config)
 
 
-def find_pages(ocr_data):
+@timed("find_pages")
+def find_pages(ocr_data, signatures, old_form=None):
+    """Map page labels to page numbers in a single pass over the lines."""
+    first_page = id_first_page(ocr_data)
+    page_map = {}
+    pending = {
+        signature.label: signature.regex
+        for signature in signatures
+        if signature.regex is not None
+    }
+    screen = combine_regexes(pending.values())
+    for page_no, text in zip(ocr_data["Page"], ocr_data["Text"]):
+        if not isinstance(text, str):
+            continue
+        if page_no == first_page:
+            if old_form is not None and old_form.search(text):
+                raise ValueError("Incorrect form version.")
+        elif not pending and page_no > first_page:
+            break
+        if screen is None or not screen.search(text):
+            continue
+        found = [
+            label for (label, regex) in pending.items() if regex.search(text)
+        ]
+        for label in found:
+            page_map[label] = page_no
+            del pending[label]
+        screen = combine_regexes(pending.values())
+    page_map["Page 1"] = first_page
+    for signature in signatures:
+        if signature.regex is not None and signature.label not in page_map:
+            if signature.missing_message:
+                logger.error(signature.missing_message)
+            page_map[signature.label] = 0
+    # Anchors are Page 1, regex pages or earlier anchored pages, as checked
+    # by load_page_signatures
+    for signature in signatures:
+        if signature.anchor is not None:
+            anchor_page = page_map[signature.anchor]
+            page_map[signature.label] = (
+                anchor_page + signature.offset if anchor_page else 0
+            )
     return {
-        "Page 1": id_first_page(ocr_data),
-        "Page 3": id_page_3(ocr_data),
-        "Page 9": id_page_9(ocr_data),
-        "Page 10": id_page_10(ocr_data),
-        "Schedule F, Page 1": (sched_f := id_sched_f(ocr_data)),
-        "Schedule F, Page 2": sched_f + 1 if sched_f else sched_f,
+        "Page 1": first_page,
+        **{
+            signature.label: page_map[signature.label]
+            for signature in signatures
+        },
     }
 
 
-def id_sched_f(ocr_data):
-    matching_page = ocr_data.loc[
-        ocr_data["Text"].str.contains(
-            "General Information on Activities Outside"
-        ),
-        "Page",
-    ]
-    if not matching_page.count():
-        return 0
-    return matching_page.iloc[0]
-
-
-def id_page_3(ocr_data):
-    matching_page = ocr_data.loc[
-        lambda df: (
-            df["Text"].str.contains("Statement of Program Service Accomplishments")
-        ),
-        "Page",
-    ]
-    if not matching_page.count():
-        logger.error("Statement of program service accomplishments missing.")
-        return 0
-    return matching_page.iloc[0]
-
-
-def id_page_9(ocr_data):
-    matching_page = ocr_data.loc[
-        ocr_data["Text"].str.contains("Statement of Revenue"),
-        "Page",
-    ]
-    if not matching_page.count():
-        logger.error("Statement of revenue missing.")
-        return 0
-    return matching_page.iloc[0]
-
-
-def id_page_10(ocr_data):
-    matching_page = ocr_data.loc[
-        ocr_data["Text"].str.contains("Statement of Functional Expenses"),
-        "Page",
-    ]
-    if not matching_page.count():
-        logger.error("Statement of functional expenses missing")
-        return 0
-    return matching_page.iloc[0]
+def combine_regexes(regexes):
+    patterns = [f"(?:{regex.pattern})" for regex in regexes]
+    if not patterns:
+        return None
+    return re.compile("|".join(patterns))
 
 
 def id_first_page(ocr_data):
@@ -72,86 +76,102 @@ def id_first_page(ocr_data):
     return 1
 
 
-def create_bounding_box(
-    roadmap,
-    left_key,
-    left_delta,
-    top_key,
-    top_delta,
-    right_key,
-    right_delta,
-    bottom_key,
-    bottom_delta,
-):
-    return BoundingBox(
-        left=get_coordinate(roadmap, left_key, "Left", "Left_Default"),
-        left_delta=left_delta,
-        top=get_coordinate(roadmap, top_key, "Top", "Top_Default"),
-        top_delta=top_delta,
-        right=get_coordinate(roadmap, right_key, "Left", "Left_Default"),
-        right_delta=right_delta,
-        bottom=get_coordinate(roadmap, bottom_key, "Top", "Top_Default"),
-        bottom_delta=bottom_delta,
+def resolve_boxes(plan, roadmap):
+    """Return every extractor's (left, right, top, bottom) in one gather."""
+    roadmap = roadmap.reindex(plan.roadmap_items)
+    left = roadmap["Left"].fillna(roadmap["Left_Default"]).to_numpy(float)
+    top = roadmap["Top"].fillna(roadmap["Top_Default"]).to_numpy(float)
+    landmarks = plan.landmarks
+    return (
+        np.column_stack(
+            [
+                left[landmarks[:, 0]],
+                left[landmarks[:, 1]],
+                top[landmarks[:, 2]],
+                top[landmarks[:, 3]],
+            ]
+        )
+        + plan.deltas
     )
 
 
-def create_extractors(extractor_df, roadmap, page_map):
-    return extractor_df.apply(
-        lambda row: Extractor(
-            name=row["field_name"],
-            strategy=row["strategy"],
-            page=page_map[row["page"]],
-            bounding_box=create_bounding_box(
-                roadmap,
-                row["left"],
-                row["left_delta"],
-                row["top"],
-                row["top_delta"],
-                row["right"],
-                row["right_delta"],
-                row["bottom"],
-                row["bottom_delta"],
-            ),
-            regex=row["regex"],
-        ),
-        axis=1,
+def find_items(lines, landmarks, page_nos):
+    """Find the first line matching each landmark near its default position."""
+    page_nos = np.asarray(page_nos)
+    text = lines["Text"].to_numpy(dtype=object)
+    line_left = lines["Left"].to_numpy()
+    line_top = lines["Top"].to_numpy()
+    page_positions = lines.groupby("Page").indices
+    regexes = landmarks["regex"].to_numpy()
+    left_default = landmarks["left_default"].to_numpy(dtype=float)
+    top_default = landmarks["top_default"].to_numpy(dtype=float)
+    x_tolerance = landmarks["x_tolerance"].to_numpy(dtype=float)
+    y_tolerance = landmarks["y_tolerance"].to_numpy(dtype=float)
+    top = np.full(len(landmarks), np.nan)
+    left = np.full(len(landmarks), np.nan)
+    for page_no in pd.unique(page_nos):
+        positions = page_positions.get(page_no)
+        if positions is None:
+            continue
+        rows = np.flatnonzero(page_nos == page_no)
+        in_window = within(
+            line_left[positions], left_default[rows], x_tolerance[rows]
+        ) & within(line_top[positions], top_default[rows], y_tolerance[rows])
+        for row, candidates in zip(rows, in_window):
+            for position in positions[candidates]:
+                line_text = text[position]
+                if isinstance(line_text, str) and regexes[row].search(
+                    line_text
+                ):
+                    top[row] = line_top[position]
+                    left[row] = line_left[position]
+                    break
+    return pd.DataFrame(
+        {
+            "Top": top,
+            "Left": left,
+            "Item": landmarks["landmark"].to_numpy(),
+            "Top_Default": top_default,
+            "Left_Default": left_default,
+        }
     )
 
 
-def find_item(
-    landmark,
-    lines,
-    page_no,
-    item_string,
-    default_left,
-    default_top,
-    x_tolerance,
-    y_tolerance,
-):
-    found = lines.loc[
-        (lines["Page"] == page_no)
-        & lines["Text"].str.contains(item_string)
-        & lines["Left"].between(
-            default_left - x_tolerance,
-            default_left + x_tolerance,
-        )
-        & lines["Top"].between(
-            default_top - y_tolerance, default_top + y_tolerance
-        ),
-        ["Top", "Left"],
-    ].reset_index()
-    found = found.drop(columns=["Id"])
-    if found["Top"].count() < 1:
-        found = pd.DataFrame(
-            {
-                "Top": [pd.NA],
-                "Left": [pd.NA],
-            }
-        )
-    return found.iloc[:1]
-
-
-def find_table_pages(page_text, table_header):
-    return page_text.loc[
-        page_text.str.contains(table_header)
-    ].index.to_series()
+def within(values, default, tolerance):
+    """Return a (defaults x values) mask of values within tolerance."""
+    low = at_precision(default - tolerance, values)[:, np.newaxis]
+    high = at_precision(default + tolerance, values)[:, np.newaxis]
+    return (values >= low) & (values <= high)
+
+
+def add_corners(roadmap):
+    """Add the page corners to a roadmap and index it by landmark."""
+    return pd.concat(
+        [
+            roadmap,
+            pd.DataFrame(
+                {
+                    "Item": list(CORNERS),
+                    "Top": [0, 1],
+                    "Left": [0, 1],
+                    "Top_Default": [0, 1],
+                    "Left_Default": [0, 1],
+                }
+            ),
+        ]
+    ).set_index("Item")
+
+
+@timed("find_tables_pages")
+def find_tables_pages(page_text, tables):
+    """Map each table's name to the pages whose text matches its header."""
+    headers = {table.name: re.compile(table.header) for table in tables}
+    table_pages = {name: [] for name in headers}
+    screen = combine_regexes(headers.values())
+    for page_no, text in page_text.items():
+        if screen is None or not screen.search(text):
+            continue
+        for name, header in headers.items():
+            if header.search(text):
+                table_pages[name].append(page_no)
+    return table_pages
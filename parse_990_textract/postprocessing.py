@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 
-from .utils import clean_num, setup_config, setup_logger
+from .utils import clean_num_frame, setup_config, setup_logger
 
 config = setup_config()
 logger = setup_logger(__name__, config)
@@ -15,14 +16,23 @@ def postprocess(data, job_id, pdf_key, clean_func):
         return clean_func(data)
 
 
+def to_dict(df):
+    """Return `df` as a dict of columns, with missing values as None."""
+    return df.astype(object).where(df.notna(), None).to_dict()
+
+
 def clean_df(df, non_numeric_columns):
+    """Parse every column not in `non_numeric_columns` as a float column."""
+    numeric = ~df.columns.isin(non_numeric_columns)
+    # Put the columns back in order by position, as names may repeat
+    positions = np.concatenate(
+        [np.flatnonzero(~numeric), np.flatnonzero(numeric)]
+    )
     return (
-        df.apply(
-            lambda x: x.map(clean_num)
-            if x.name not in non_numeric_columns
-            else x,
-            axis=0,
+        pd.concat(
+            [df.loc[:, ~numeric], clean_num_frame(df.loc[:, numeric])], axis=1
         )
+        .iloc[:, positions.argsort()]
         .reset_index(drop=True)
         .assign(
             split_pdf_key=lambda df: df["pdf_key"].str.split("_"),
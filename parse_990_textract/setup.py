@@ -1,10 +1,227 @@
+import dataclasses
+import functools
+import glob
+import hashlib
+import os
+import pickle
 import re
+import tempfile
+import typing
 
+import numpy as np
 import pandas as pd
 
+from .utils import setup_config, setup_logger
+
+config = setup_config()
+logger = setup_logger(__name__, config)
+
+PARSE_DATA_DIR = "parse_data"
+SPEC_BUNDLE = "parse_spec.pickle"
+CORNERS = ("Top Left Corner", "Bottom Right Corner")
+OLD_FORM = r"Net rental income|Direct public|2007 calendar"
+TABLE_HEADERS = {
+    "Activities per Region": (
+        r"\(a\)\s*Region|\(d\)\s*Activities|\(e\)\s*"
+        r"If activity|\(f\)Total expenditures"
+    ),
+    "Grants to Organizations Outside the United States": (
+        r"\(b\)\s*IRS code|\(c\)\s*Region|\(d\)\s*"
+        r"Purpose|\(f\)\s*Manner|\(h\)\s*Description"
+    ),
+    "Grants to Individuals Outside the United States": (
+        r"\(b\)\s*Region|\(e\)\s*Manner of cash|\(h\)\s*Method of va"
+    ),
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class TableSpec:
+    name: str
+    header: re.Pattern
+
+
+@dataclasses.dataclass(frozen=True)
+class PageSignature:
+    """A page identified by a phrase, or by its offset from another page."""
+
+    label: str
+    regex: typing.Optional[re.Pattern]
+    anchor: typing.Optional[str] = None
+    offset: int = 0
+    missing_message: typing.Optional[str] = None
+
+
+@dataclasses.dataclass(frozen=True)
+class ExtractorPlan:
+    """The parts of every filing extractor that don't depend on the filing."""
+
+    names: tuple[str, ...]
+    strategies: np.ndarray
+    page_labels: tuple[str, ...]
+    # Indexes into page_labels
+    page_codes: np.ndarray
+    # Roadmap positions of each extractor's left, right, top and bottom
+    # landmarks, and the offsets added to their coordinates
+    landmarks: np.ndarray
+    deltas: np.ndarray
+    # Indexes into regexes, the distinct field regexes
+    regex_codes: np.ndarray
+    regexes: tuple[re.Pattern, ...]
+    roadmap_items: tuple[str, ...]
+
+
+@dataclasses.dataclass(frozen=True)
+class ParseSpec:
+    """Roadmaps and extractors for a 990, with every regex compiled."""
+
+    # Every filing parsed in the process shares the spec, so treat its
+    # DataFrames as read-only
+    extractors: pd.DataFrame
+    extractor_plan: ExtractorPlan
+    roadmap: pd.DataFrame
+    tablemap: pd.DataFrame
+    table_extractors: pd.DataFrame
+    row_extractors: pd.DataFrame
+    tables: tuple[TableSpec, ...]
+    pages: tuple[PageSignature, ...]
+    old_form: re.Pattern
+
 
 def load_extractor_df(fname):
-    """Read extractors from CSV and compile regexes."""
+    """Read extractors or landmarks from CSV and compile regexes."""
     return pd.read_csv(fname).assign(
         regex=lambda df: df["regex"].map(re.compile)
     )
+
+
+def load_page_signatures(fname):
+    """Read page signatures from CSV and compile regexes."""
+    pages = pd.read_csv(fname, dtype={"offset": int}).astype(object)
+    pages = pages.where(pages.notna(), None)
+    known = {"Page 1", *pages.loc[pages["regex"].notna(), "label"]}
+    for label, anchor in zip(pages["label"], pages["anchor"]):
+        if anchor is None:
+            continue
+        if anchor not in known:
+            raise ValueError(f"Unknown anchor {anchor!r} for page {label!r}.")
+        known.add(label)
+    return tuple(
+        PageSignature(
+            label=row["label"],
+            regex=re.compile(row["regex"]) if row["regex"] else None,
+            anchor=row["anchor"],
+            offset=row["offset"],
+            missing_message=row["missing_message"],
+        )
+        for (_idx, row) in pages.iterrows()
+    )
+
+
+def compile_extractor_plan(extractors, roadmap):
+    """Resolve extractors' landmarks to positions in the filing roadmap."""
+    # The order of the roadmap made for a filing by create_roadmap
+    items = pd.Index([*roadmap["landmark"], *CORNERS])
+    sides = ["left", "right", "top", "bottom"]
+    landmarks = np.column_stack(
+        [items.get_indexer(extractors[side]) for side in sides]
+    )
+    repeated = extractors["field_name"][extractors["field_name"].duplicated()]
+    if len(repeated):
+        # Repeated fields become repeated columns of the filing row
+        logger.warning(f"Repeated field names: {sorted(set(repeated))}")
+    if (landmarks < 0).any():
+        unknown = extractors[sides].to_numpy()[landmarks < 0]
+        raise KeyError(f"Unknown landmarks: {sorted(set(unknown))}")
+    page_codes, page_labels = pd.factorize(extractors["page"])
+    regex_codes, regexes = pd.factorize(extractors["regex"])
+    return ExtractorPlan(
+        names=tuple(extractors["field_name"]),
+        strategies=extractors["strategy"].to_numpy(dtype=object),
+        page_labels=tuple(page_labels),
+        page_codes=page_codes,
+        landmarks=landmarks,
+        deltas=extractors[[f"{side}_delta" for side in sides]].to_numpy(
+            dtype=float
+        ),
+        regex_codes=regex_codes,
+        regexes=tuple(regexes),
+        roadmap_items=tuple(items),
+    )
+
+
+def load_parse_spec(directory=PARSE_DATA_DIR):
+    """Read every roadmap and extractor CSV in `directory`."""
+    extractors = load_extractor_df(
+        os.path.join(directory, "990_extractors.csv")
+    )
+    roadmap = load_extractor_df(os.path.join(directory, "990_roadmap.csv"))
+    return ParseSpec(
+        extractors=extractors,
+        extractor_plan=compile_extractor_plan(extractors, roadmap),
+        roadmap=roadmap,
+        tablemap=load_extractor_df(
+            os.path.join(directory, "schedule_f_table_roadmap.csv")
+        ),
+        table_extractors=pd.read_csv(
+            os.path.join(directory, "schedule_f_table_extractors.csv")
+        ),
+        row_extractors=pd.read_csv(
+            os.path.join(directory, "schedule_f_row_extractors.csv")
+        ),
+        tables=tuple(
+            TableSpec(name=name, header=re.compile(header))
+            for (name, header) in TABLE_HEADERS.items()
+        ),
+        pages=load_page_signatures(os.path.join(directory, "990_pages.csv")),
+        old_form=re.compile(OLD_FORM),
+    )
+
+
+def spec_key(directory=PARSE_DATA_DIR):
+    """Return a digest of the CSVs in `directory` and the code reading them."""
+    digest = hashlib.sha1(f"{pd.__version__} {np.__version__}".encode())
+    for fname in [__file__, *sorted(glob.glob(f"{directory}/*.csv"))]:
+        with open(fname, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def write_spec_bundle(directory=PARSE_DATA_DIR):
+    """Pickle the spec for `directory` into it, to skip parsing the CSVs."""
+    path = os.path.join(directory, SPEC_BUNDLE)
+    spec = load_parse_spec(directory)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+        # The key comes first, so it is checked before unpickling the spec
+        pickle.dump(spec_key(directory), tmp)
+        pickle.dump(spec, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+    # Temporary files are private, but the Lambda user must read the bundle
+    os.chmod(tmp.name, 0o644)
+    os.replace(tmp.name, path)
+    return path
+
+
+def read_spec_bundle(directory=PARSE_DATA_DIR):
+    """Return the bundled spec for `directory`, or None if missing or stale."""
+    try:
+        with open(os.path.join(directory, SPEC_BUNDLE), "rb") as f:
+            if pickle.load(f) != spec_key(directory):
+                return None
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_parse_spec(directory=PARSE_DATA_DIR):
+    """Return the spec for `directory`, loading it on first use."""
+    spec = read_spec_bundle(directory)
+    if spec is None:
+        spec = load_parse_spec(directory)
+    return spec
+
+
+def reload_parse_spec(directory=PARSE_DATA_DIR):
+    """Discard loaded specs and reload, e.g. after editing the CSVs."""
+    get_parse_spec.cache_clear()
+    return get_parse_spec(directory)
@@ -0,0 +1,107 @@
+import gzip
+import mmap
+import os
+import posixpath
+from urllib.parse import urlsplit
+
+from .bucket import DOWNLOAD_WORKERS, get_bucket
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class GzipPart(gzip.GzipFile):
+    """Decompress a part as it is read, closing its body when done."""
+
+    def __init__(self, body):
+        super().__init__(fileobj=body, mode="rb")
+        self.body = body
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.body.close()
+
+
+class S3Source:
+    """Textract output parts stored in an S3 bucket."""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def __str__(self):
+        return f"s3://{self.bucket.name}"
+
+    def list_keys(self, prefix):
+        return [obj.key for obj in self.bucket.objects.filter(Prefix=prefix)]
+
+    def open(self, key):
+        # Clients are thread-safe, unlike the resource objects that wrap them
+        response = self.bucket.meta.client.get_object(
+            Bucket=self.bucket.name, Key=key
+        )
+        if key.endswith(".gz") or response.get("ContentEncoding") == "gzip":
+            return GzipPart(response["Body"])
+        return response["Body"]
+
+
+class LocalSource:
+    """Textract output parts mirrored to a local directory."""
+
+    def __init__(self, directory, use_mmap=True):
+        self.directory = directory
+        self.use_mmap = use_mmap
+
+    def __str__(self):
+        return f"file://{os.path.abspath(self.directory)}"
+
+    def list_keys(self, prefix):
+        head, tail = posixpath.split(prefix)
+        root = os.path.join(self.directory, *head.split("/"))
+        try:
+            entries = list(os.scandir(root))
+        except FileNotFoundError:
+            return []
+        keys = []
+        for entry in entries:
+            if not entry.name.startswith(tail):
+                continue
+            if entry.is_dir():
+                keys.extend(
+                    self.key(os.path.join(dirpath, fname))
+                    for (dirpath, _dirs, fnames) in os.walk(entry.path)
+                    for fname in fnames
+                )
+            else:
+                keys.append(self.key(entry.path))
+        return sorted(keys)
+
+    def key(self, path):
+        return os.path.relpath(path, self.directory).replace(os.sep, "/")
+
+    def open(self, key):
+        f = open(os.path.join(self.directory, *key.split("/")), "rb")
+        if self.use_mmap and os.fstat(f.fileno()).st_size:
+            try:
+                body = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            finally:
+                # The map keeps its own handle to the file
+                f.close()
+        else:
+            body = f
+        if body.read(2) == GZIP_MAGIC:
+            body.seek(0)
+            return GzipPart(body)
+        body.seek(0)
+        return body
+
+
+def get_source(location, max_workers=DOWNLOAD_WORKERS):
+    """Return the source of Textract output at a URL."""
+    url = urlsplit(location)
+    # A location without a scheme is the name of an S3 bucket
+    if url.scheme in ("", "s3"):
+        return S3Source(get_bucket(url.netloc or url.path, max_workers))
+    if url.scheme == "file":
+        return LocalSource(url.netloc + url.path)
+    raise ValueError(f"Unsupported Textract output location {location!r}.")
@@ -0,0 +1,108 @@
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+EXCLUDED_FIELDS = (
+    "ColumnIndex",
+    "ColumnSpan",
+    "DocumentType",
+    "EntityTypes",
+    "Hint",
+    "Query",
+    "SelectionStatus",
+    "RowIndex",
+    "RowSpan",
+)
+
+
+class JSONStream:
+    """Decode JSON values one at a time from a binary file-like object."""
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk into the buffer. Return False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(self.chunk_size)
+        self.eof = not chunk
+        pos, self.pos = self.pos, 0
+        self.buffer = self.buffer[pos:] + self.utf8.decode(
+            chunk, final=self.eof
+        )
+        return not self.eof
+
+    def peek(self):
+        """Skip whitespace and return the next character."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON document.")
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r}.")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_blocks(fileobj, exclude=EXCLUDED_FIELDS):
+    """Yield blocks from a Textract output document one at a time."""
+    stream = JSONStream(fileobj)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "Blocks":
+            yield from iter_array(stream, exclude)
+        else:
+            stream.value()
+        if stream.peek() != ",":
+            stream.expect("}")
+            return
+        stream.pos += 1
+
+
+def iter_array(stream, exclude):
+    stream.expect("[")
+    if stream.peek() == "]":
+        stream.pos += 1
+        return
+    while True:
+        block = stream.value()
+        for field in exclude:
+            block.pop(field, None)
+        yield block
+        if stream.peek() != ",":
+            stream.expect("]")
+            return
+        stream.pos += 1
@@ -1,50 +1,104 @@
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 
+from .metrics import stage, timed
 from .models import TableExtractor
-from .parse import find_item, find_table_pages
-from .utils import setup_config, setup_logger
+from .parse import add_corners, find_items, find_tables_pages
+from .setup import TableSpec
+from .utils import page_view, setup_config, setup_logger
 
 config = setup_config()
 logger = setup_logger(__name__, config)
+TABLE_WORKERS = int(config.get("PARSE_990_TEXTRACT_TABLE_WORKERS", 1))
+
+
+def create_tablemap(lines, landmarks, page):
+    tablemap = find_items(lines, landmarks, np.full(len(landmarks), page))
+    return add_corners(tablemap)
+
+
+def extract_page_rows(lines, words, page, landmarks, table, row_extractors):
+    """Extract the rows of one table from one page."""
+    lines, words = page_view(lines, page), page_view(words, page)
+    with stage("table_page", table=table["table"], page=int(page)):
+        extractor = TableExtractor(
+            header_top_label=table["header_top"],
+            top_label=table["table_top"],
+            bottom_label=table["table_bottom"],
+            tablemap=create_tablemap(lines, landmarks, page).dropna(),
+            fields=row_extractors["field"].reset_index(drop=True),
+            field_labels=row_extractors["col_left"].reset_index(drop=True),
+        )
+        return extractor.extract_rows(words, page)
+
+
+def combine_pages(page_results):
+    """Concatenate a table's rows from each page, or return None."""
+    try:
+        rows = [result() for result in page_results]
+    except KeyError as e:
+        logger.error(f"{type(e)}: {e}")
+        return None
+    rows = [page_rows for page_rows in rows if page_rows is not pd.NA]
+    if rows:
+        return pd.concat(rows).reset_index(drop=True)
 
 
-def create_tablemap(lines, tablemap_df, page, table_name):
-    roadmap = pd.concat(
-        tablemap_df.loc[tablemap_df["table"] == table_name]
-        .apply(
-            lambda row: find_item(
-                row["landmark"],
+@timed("extract_tables")
+def extract_tables(
+    pages,
+    lines,
+    words,
+    tables,
+    tablemap_df,
+    table_extractor_df,
+    row_extractor_df,
+    max_workers=TABLE_WORKERS,
+    table_pages=None,
+):
+    """Extract every table in `tables`, sharing the work between them."""
+    if table_pages is None:
+        table_pages = find_tables_pages(
+            pages["Text"].agg(lambda words: " ".join(words)), tables
+        )
+    landmarks = dict(tuple(tablemap_df.groupby("table", sort=False)))
+    settings = dict(tuple(table_extractor_df.groupby("table", sort=False)))
+    row_extractors = dict(tuple(row_extractor_df.groupby("table", sort=False)))
+    tasks = {}
+    for table in tables:
+        tasks[table.name] = [
+            functools.partial(
+                extract_page_rows,
                 lines,
+                words,
                 page,
-                row["regex"],
-                row["left_default"],
-                row["top_default"],
-                row["x_tolerance"],
-                row["y_tolerance"],
-            ).assign(
-                Item=row["landmark"],
-                Top_Default=row["top_default"],
-                Left_Default=row["left_default"],
-            ),
-            axis=1,
-        )
-        .values
-    )
-    tablemap = pd.concat(
-        [
-            roadmap,
-            pd.DataFrame(
-                {
-                    "Item": ["Top Left Corner", "Bottom Right Corner"],
-                    "Top": [0, 1],
-                    "Left": [0, 1],
-                    "Top_Default": [0, 1],
-                    "Left_Default": [0, 1],
-                }
-            ),
+                landmarks.get(table.name, tablemap_df.iloc[:0]),
+                settings[table.name].iloc[0],
+                row_extractors.get(table.name, row_extractor_df.iloc[:0]),
+            )
+            for page in table_pages[table.name]
         ]
-    ).set_index("Item")
-    return tablemap
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                # Each page runs in a copy of this context, to record metrics
+                name: [
+                    executor.submit(contextvars.copy_context().run, task)
+                    for task in page_tasks
+                ]
+                for (name, page_tasks) in tasks.items()
+            }
+            return {
+                name: combine_pages(future.result for future in page_futures)
+                for (name, page_futures) in futures.items()
+            }
+    return {
+        name: combine_pages(page_tasks) for (name, page_tasks) in tasks.items()
+    }
 
 
 def extract_table_data(
@@ -57,53 +111,12 @@ def extract_table_data(
     table_extractor_df,
     row_extractor_df,
 ):
-    table_pages = find_table_pages(
-        pages["Text"].agg(lambda words: " ".join(words)),
-        header,
-    )
-
-    tablemaps = pd.DataFrame(
-        {
-            "page": table_pages,
-            "tablemap": table_pages.map(
-                lambda page: create_tablemap(
-                    lines, tablemap_df, page, table_name
-                ).dropna()
-            ),
-        }
-    )
-
-    table_row_extractors = row_extractor_df.loc[
-        row_extractor_df["table"] == table_name
-    ]
-    table = table_extractor_df.loc[
-        table_extractor_df["table"] == table_name
-    ].iloc[0]
-    try:
-        extractors = tablemaps.assign(
-            extractor=tablemaps["tablemap"].map(
-                lambda tablemap: TableExtractor(
-                    header_top_label=table["header_top"],
-                    top_label=table["table_top"],
-                    bottom_label=table["table_bottom"],
-                    tablemap=tablemap,
-                    fields=table_row_extractors["field"].reset_index(
-                        drop=True
-                    ),
-                    field_labels=table_row_extractors["col_left"].reset_index(
-                        drop=True
-                    ),
-                ),
-            ),
-        )
-
-        rows = extractors.apply(
-            lambda row: row["extractor"].extract_rows(words, row["page"]),
-            axis=1,
-        ).dropna()
-
-    except KeyError as e:
-        logger.error(f"{type(e)}: {e}")
-    else:
-        if rows.count().any():
-            return pd.concat(rows.values).reset_index(drop=True)
+    return extract_tables(
+        pages,
+        lines,
+        words,
+        (TableSpec(name=table_name, header=header),),
+        tablemap_df,
+        table_extractor_df,
+        row_extractor_df,
+    )[table_name]
@@ -1,13 +1,17 @@
+import functools
 import logging
 import math
 import os
 import re
 
+import numpy as np
 import pandas as pd
 from dotenv import dotenv_values
 
 
+@functools.lru_cache(maxsize=None)
 def setup_config(env_file_var="ENVFILE", env_file_default=".env.local"):
+    """Read the env file once per process; every module shares the result."""
     return dotenv_values(os.getenv(env_file_var, env_file_default))
 
 
@@ -32,13 +36,6 @@ def trunc_num(value, places):
     return math.trunc(value * 10**places) / 10**places
 
 
-def get_regex(string, regex, match_group=0, alt_value=None):
-    match = regex.search(string)
-    if match is not None:
-        return match.group(match_group)
-    return alt_value
-
-
 def get_best_match(string, regex, alt_value=None):
     match = regex.search(string)
     if match is not None:
@@ -55,136 +52,177 @@ def get_coordinate(roadmap, index, col, default):
     return value
 
 
+NUMERIC_TEXT = re.compile(r"^[\doOliIZS ,$.()-]+$")
+NUMERIC_NOISE = re.compile(r"[^-.\d()]|\.$|(?<=.)[-(]|\)(?=.)")
+PARENTHESES = re.compile(r"[()]")
+OCR_DIGITS = str.maketrans("oOliIZS", "0011125")
+
+
+@functools.lru_cache(maxsize=4096)
 def clean_num(text) -> str:
-    if re.search(r"^[\doOliIZS ,$.()-]+$", str(text)):
-        fix_zeroes = re.sub(r"[oO]", "0", str(text).strip())
-        fix_ones = re.sub(r"[liI]", "1", fix_zeroes)
-        fix_twos = re.sub("Z", "2", fix_ones)
-        fix_fives = re.sub(r"S", "5", fix_twos)
-        cleaned = re.sub(r"[^-.\d()]|\.$|(?<=.)[-(]|\)(?=.)", "", fix_fives)
+    if NUMERIC_TEXT.search(str(text)):
+        fixed = str(text).strip().translate(OCR_DIGITS)
+        cleaned = NUMERIC_NOISE.sub("", fixed)
         if cleaned.startswith("(") and cleaned.endswith(")"):
             return f"-{cleaned[1:-1]}"
         else:
-            return re.sub(r"[()]", "", cleaned)
+            return PARENTHESES.sub("", cleaned)
     if text:
         logger.info(str(text))
     return ""
 
 
-def cluster_words(words, tolerance, attribute):
-    if (tolerance == 0) or (words.shape[0] < 2):
-        return [
-            pd.DataFrame([word])
-            for (_idx, word) in words.sort_values(by=attribute).iterrows()
-        ]
-    groups = []
-    sorted_words = words.sort_values(by=attribute)
-    current_group = [sorted_words.iloc[0]]
-    last = sorted_words.iloc[0][attribute]
-    for _idx, word in sorted_words.iloc[1:].iterrows():
-        if word[attribute] <= (last + tolerance):
-            current_group.append(word)
-        else:
-            groups.append(current_group)
-            current_group = [word]
-        last = word[attribute]
-    groups.append(current_group)
-    return [pd.DataFrame(group) for group in groups]
-
-
-def get_cluster_coords(cluster):
-    cluster_coords = {
-        "Left": cluster["Left"].min(),
-        "Right": cluster["Right"].max(),
-        "Height": cluster["Height"].max(),
-        "Midpoint_X": cluster["Midpoint_X"].median(),
-        "Midpoint_Y": cluster["Midpoint_Y"].median(),
-        "Top": cluster["Top"].min(),
-        "Bottom": cluster["Bottom"].min(),
-    }
-    cluster_coords["Width"] = cluster_coords["Right"] - cluster_coords["Left"]
-    return cluster_coords
-
-
-def columnize(word_cluster, col_spans):
-    return col_spans.map(
-        lambda span: word_cluster.loc[
-            word_cluster["Right"].between(*span, inclusive="right")
-        ]
+def clean_num_frame(df):
+    """Clean every column of OCR'd amounts in `df` and parse them as floats."""
+    values = df.to_numpy(dtype=object)
+    codes, uniques = pd.factorize(values.ravel())
+    cleaned = pd.to_numeric(
+        pd.Series([clean_num(value) for value in uniques], dtype=object),
+        errors="coerce",
+    ).to_numpy(dtype=float)
+    # Missing values have code -1, which picks the trailing NaN
+    cleaned = np.append(cleaned, np.nan)
+    return pd.DataFrame(
+        cleaned.take(codes).reshape(values.shape),
+        index=df.index,
+        columns=df.columns,
     )
 
 
-def cluster_x(words, tolerance):
-    if (tolerance == 0) or (words.shape[0] < 2):
-        return [
-            [word] for (_idx, word) in words.sort_values(by="Left").iterrows()
-        ]
-    groups = []
-    sorted_words = words.sort_values(by="Left")
-    current_group = [sorted_words.iloc[0]]
-    last = sorted_words.iloc[0]["Right"]
-    for _idx, word in sorted_words.iloc[1:].iterrows():
-        if word["Left"] <= (last + tolerance):
-            current_group.append(word)
-        else:
-            groups.append(current_group)
-            current_group = [word]
-        last = max((word["Right"], last))
-    groups.append(current_group)
-    return [pd.DataFrame(group) for group in groups]
-
-
-def rotate(textract_obj):
-    height = textract_obj["Height"]
-    width = textract_obj["Width"]
-    left = textract_obj["Left"]
-    right = textract_obj["Right"]
-    top = textract_obj["Top"]
-    bottom = textract_obj["Bottom"]
-    midpoint_x = textract_obj["Midpoint_X"]
-    midpoint_y = textract_obj["Midpoint_Y"]
-    new_obj = textract_obj.copy()
-    new_obj["Height"] = width
-    new_obj["Width"] = height
-    new_obj["Left"] = 1 - bottom
-    new_obj["Right"] = 1 - top
-    new_obj["Top"] = left
-    new_obj["Bottom"] = right
-    new_obj["Midpoint_X"] = 1 - midpoint_y
-    new_obj["Midpoint_Y"] = midpoint_x
-    return new_obj
-
-
-def id_rotated_pages(df):
+def label_clusters(values, tolerance):
+    """Return cluster ids for `values`, which must be sorted ascending."""
+    values = np.asarray(values, dtype=float)
+    if (tolerance == 0) or (values.shape[0] < 2):
+        return np.arange(values.shape[0])
+    starts = ~(values[1:] <= values[:-1] + tolerance)
+    return np.concatenate([[0], np.cumsum(starts)])
+
+
+def cluster_labels(words, tolerance, attribute):
+    """Sort words by `attribute` and label clusters of nearby values."""
+    sorted_words = words.sort_values(by=attribute, kind="stable")
+    return pd.Series(
+        label_clusters(sorted_words[attribute], tolerance),
+        index=sorted_words.index,
+    )
+
+
+ROTATION_COLUMNS = [
+    "Left",
+    "Right",
+    "Top",
+    "Bottom",
+    "Midpoint_X",
+    "Midpoint_Y",
+    "Height",
+    "Width",
+]
+
+
+def get_orientation(delta_x, delta_y):
+    """Return text orientation in degrees from the first polygon edges."""
+    # Polygons start at the text's top-left corner and go clockwise, so the
+    # first edge runs in the reading direction
+    return np.where(
+        np.abs(delta_x) >= np.abs(delta_y),
+        np.where(delta_x >= 0, 0, 180),
+        np.where(delta_y < 0, 90, 270),
+    ).astype(np.int16)
+
+
+def id_page_orientations(df):
+    """Return the most common LINE orientation for each page."""
     lines = df.loc[df["BlockType"] == "LINE"]
-    by_page = lines.groupby("Page")
-    return (by_page["Width"].mean() / by_page["Height"].mean())[
-        lambda x: x < 0.5
-    ].index.values
-
-
-def rotate_pages(df):
-    rotated_pages = id_rotated_pages(df.loc[df["BlockType"] == "LINE"])
-    return df.mask(df["Page"].isin(rotated_pages), rotate, axis=1)
-
-
-def combine_row(row):
-    combined_row = (
-        pd.Series(
-            [
-                line.map(
-                    lambda x: x.sort_values(by="Left")
-                    .reset_index(drop=True)["Text"]
-                    .fillna("")
-                ).agg(lambda x: " ".join(x.values))
-                + " "
-                for line in row
-            ]
-        )
-        .sum()
-        .str.strip()
+    counts = lines.groupby(["Page", "Orientation"]).size()
+    # Counts are sorted by orientation, so ties go to the smallest angle
+    return (
+        counts.groupby(level="Page")
+        .idxmax()
+        .map(lambda page_orientation: page_orientation[1])
     )
-    return combined_row
+
+
+def rotate_pages(df, page_orientations=None):
+    """Rotate coordinates of blocks on rotated pages to reading orientation."""
+    if page_orientations is None:
+        page_orientations = id_page_orientations(df)
+    block_orientations = (
+        df["Page"].map(page_orientations).fillna(0).astype(int).values
+    )
+    if not block_orientations.any():
+        return df
+    df = df.copy()
+    rotate_blocks(df, block_orientations)
+    return df
+
+
+def rotate_blocks(df, block_orientations):
+    """Rotate the coordinates of each block by its orientation, in place."""
+    coords = {col: df[col].values for col in ROTATION_COLUMNS}
+    for degrees in (90, 180, 270):
+        mask = block_orientations == degrees
+        if not mask.any():
+            continue
+        rotated = rotate(
+            {col: values[mask] for (col, values) in coords.items()},
+            degrees,
+        )
+        for col, values in rotated.items():
+            df.loc[mask, col] = values
+
+
+def rotate(coords, degrees):
+    """Map block coordinates on a page rotated by `degrees` to upright."""
+    if degrees == 90:
+        return {
+            "Height": coords["Width"],
+            "Width": coords["Height"],
+            "Left": 1 - coords["Bottom"],
+            "Right": 1 - coords["Top"],
+            "Top": coords["Left"],
+            "Bottom": coords["Right"],
+            "Midpoint_X": 1 - coords["Midpoint_Y"],
+            "Midpoint_Y": coords["Midpoint_X"],
+        }
+    if degrees == 180:
+        return {
+            "Height": coords["Height"],
+            "Width": coords["Width"],
+            "Left": 1 - coords["Right"],
+            "Right": 1 - coords["Left"],
+            "Top": 1 - coords["Bottom"],
+            "Bottom": 1 - coords["Top"],
+            "Midpoint_X": 1 - coords["Midpoint_X"],
+            "Midpoint_Y": 1 - coords["Midpoint_Y"],
+        }
+    if degrees == 270:
+        return {
+            "Height": coords["Width"],
+            "Width": coords["Height"],
+            "Left": coords["Top"],
+            "Right": coords["Bottom"],
+            "Top": 1 - coords["Right"],
+            "Bottom": 1 - coords["Left"],
+            "Midpoint_X": coords["Midpoint_Y"],
+            "Midpoint_Y": 1 - coords["Midpoint_X"],
+        }
+    return coords
+
+
+def at_precision(values, coordinates):
+    """Return `values` as floats at the precision of `coordinates`."""
+    # pandas compares a float32 column to a bound at float32 precision
+    return np.asarray(values, dtype=float).astype(coordinates.dtype)
+
+
+def page_view(df, page):
+    """Return the blocks in `df` on `page`, as a slice if sorted by page."""
+    if not df["Page"].is_monotonic_increasing:
+        return df.loc[df["Page"] == page]
+    pages = df["Page"].to_numpy()
+    start = pages.searchsorted(page, side="left")
+    end = pages.searchsorted(page, side="right")
+    return df.iloc[start:end]
 
 
 def find_crossing_right(df, right):
@@ -193,13 +231,32 @@ def find_crossing_right(df, right):
     ].min()
 
 
-def sort_words(df):
-    """Cluster words into lines, then sort left to right."""
-    lines = cluster_words(df, df["Height"].min(), "Midpoint_Y")
-    sorted_words = pd.concat(
-        [
-            cluster.sort_values("Left") for cluster in lines
-        ]
+def reading_order(df):
+    """Sort blocks by page and Midpoint_Y, and number them in reading order."""
+    if df.empty:
+        return df.assign(LineCluster=0, WordIndex=0)
+    page = df["Page"].to_numpy()
+    midpoint_y = df["Midpoint_Y"].to_numpy(dtype=float)
+    order = np.lexsort((midpoint_y, page))
+    page, midpoint_y = page[order], midpoint_y[order]
+    tolerance = (
+        df["Height"].groupby(df["Page"]).transform("min").to_numpy(dtype=float)
+    )[order]
+    new_page = np.concatenate([[True], page[1:] != page[:-1]])
+    starts = new_page.copy()
+    starts[1:] |= ~(midpoint_y[1:] <= midpoint_y[:-1] + tolerance[1:]) | (
+        tolerance[1:] == 0
+    )
+    clusters = np.cumsum(starts) - 1
+    left = df["Left"].to_numpy()[order]
+    word_order = np.lexsort((left, clusters))
+    ordered_page = page[word_order]
+    first_on_page = np.concatenate(
+        [[True], ordered_page[1:] != ordered_page[:-1]]
+    )
+    page_start = np.maximum.accumulate(
+        np.where(first_on_page, np.arange(len(order)), 0)
     )
-    word_order = sorted_words.reset_index().index
-    return pd.Series(word_order, index=sorted_words.index)
+    word_index = np.empty(len(order), dtype=np.int64)
+    word_index[word_order] = np.arange(len(order)) - page_start
+    return df.iloc[order].assign(LineCluster=clusters, WordIndex=word_index)